@@ -1,17 +1,86 @@
+import logging
 import os
 import gradio as gr
-from utils import process_pdf_file
+from utils import iter_process_pdf_file, prewarm_converter
 from styles import THEME_CONFIG, TABLE_CONFIG
-from config import ENABLE_CACHE
+from config import ENABLE_CACHE, ANALYSIS_MODE, LOG_LEVEL, METRICS_PORT
+from metrics import start_metrics_server
+from database import get_pdf_cache
+from viewer import open_book, open_cached_book, render_page, chapter_choices, chapter_page, page_of
 
 # 创建输出目录
 output_dir = os.path.join(os.getcwd(), "output")
 os.makedirs(output_dir, exist_ok=True)
 
-def process_pdf(pdf_file, api_key=None, enable_cache=ENABLE_CACHE, progress=gr.Progress()):
-    """处理PDF文件，转换为Markdown并生成摘要"""
-    chapter_data, character_data, md_content, translation = process_pdf_file(pdf_file, output_dir, api_key, enable_cache)
-    return chapter_data, character_data, md_content, translation
+def process_pdf_stream(pdf_file, api_key=None, enable_cache=ENABLE_CACHE, analysis_mode=ANALYSIS_MODE, progress=gr.Progress()):
+    """处理PDF文件，摘要和翻译一旦生成就逐步显示
+
+    原文和译文只发送当前页，整本书保存在服务端的阅读器状态中，翻页时按索引取出对应的一页。
+    原文出现后只显示一次第1页，之后只更新阅读器状态，不覆盖用户正在翻阅的页；
+    处理结束后由show_page按用户当前的页码重新显示。
+    """
+    sent = {}
+    shown = False
+    
+    def diff(key, value, wrap=None):
+        # 未变化的输出不重复发送
+        if key in sent and (sent[key] is value or sent[key] == value):
+            return gr.update()
+        sent[key] = value
+        return wrap(value) if wrap else value
+    
+    result = None
+    for result in iter_process_pdf_file(pdf_file, output_dir, api_key, enable_cache, analysis_mode=analysis_mode, progress=progress):
+        chapter_data, character_data, md_content, translation = result
+        book = open_book(md_content, translation, complete=False)
+        if shown:
+            panes = (gr.update(),) * 4
+        else:
+            panes = render_page(book, 1)
+            shown = bool(md_content)
+        yield (
+            diff("chapters", chapter_data),
+            diff("characters", character_data),
+            book,
+            panes[0],
+            panes[1],
+            diff("toc", chapter_choices(book), lambda choices: gr.update(choices=choices, value=None)),
+            panes[2],
+            panes[3],
+        )
+
+    if result is None or not pdf_file:
+        return
+    chapter_data, character_data, md_content, translation = result
+    book = open_cached_book(get_pdf_cache().calculate_md5(pdf_file), md_content, translation)
+    yield gr.update(), gr.update(), book, gr.update(), gr.update(), gr.update(choices=chapter_choices(book), value=None), gr.update(), gr.update()
+
+def show_page(book, page):
+    """显示指定页的原文和译文"""
+    return render_page(book, page)
+
+def show_chapter(book, chapter):
+    """跳转到章节所在的页"""
+    return render_page(book, chapter_page(book, chapter))
+
+SEARCH_KINDS = {"content": "原文", "translation": "译文", "chapter": "章节摘要", "character": "人物志"}
+
+def search_books(query):
+    """在所有缓存的图书中搜索，原文和译文的结果标出所在页码"""
+    cache = get_pdf_cache()
+    indexes = {}
+    rows = []
+    for result in cache.search(query or ""):
+        if result["position"] is not None:
+            md5_hash = result["md5_hash"]
+            if md5_hash not in indexes:
+                indexes[md5_hash] = cache.get_index(md5_hash)
+            index = indexes[md5_hash]
+            location = f"第{page_of(index[result['kind'] + '_pages'], result['position'])}页" if index else ""
+        else:
+            location = result["label"]
+        rows.append([result["book"], SEARCH_KINDS.get(result["kind"], result["kind"]), location, result["snippet"]])
+    return rows
 
 # 创建Gradio界面
 with gr.Blocks(**THEME_CONFIG) as demo:
@@ -26,6 +95,11 @@ with gr.Blocks(**THEME_CONFIG) as demo:
             type="password"
         )
         enable_cache = gr.Checkbox(label="缓存加速", value=ENABLE_CACHE)
+        analysis_mode = gr.Dropdown(
+            label="摘要方式",
+            choices=[("章节摘要和人物志分别生成", "separate"), ("一次请求同时生成（更省token）", "combined")],
+            value=ANALYSIS_MODE
+        )
         submit_btn = gr.Button("开始处理")
 
     with gr.Tabs() as tabs:
@@ -35,18 +109,37 @@ with gr.Blocks(**THEME_CONFIG) as demo:
         with gr.TabItem("人物志"):
             summary_charaters = gr.Dataframe(**TABLE_CONFIG["character_table"])
             
-        with gr.TabItem("原文"):
-            markdown_output = gr.Markdown()
-            
-        with gr.TabItem("中文翻译"):
-            translation_output = gr.Markdown()
+        with gr.TabItem("原文与翻译"):
+            book_state = gr.State()
+            with gr.Row():
+                prev_btn = gr.Button("上一页")
+                page_number = gr.Number(label="页码", value=1, precision=0, minimum=1)
+                next_btn = gr.Button("下一页")
+                chapter_select = gr.Dropdown(label="跳转到章节", choices=[], value=None)
+            page_info = gr.Markdown()
+            with gr.Row():
+                markdown_output = gr.Markdown(label="原文")
+                translation_output = gr.Markdown(label="中文翻译")
+
+        with gr.TabItem("全文搜索"):
+            with gr.Row():
+                search_input = gr.Textbox(label="搜索已处理的图书", placeholder="输入关键词，多个关键词用空格分隔", scale=4)
+                search_btn = gr.Button("搜索", scale=1)
+            search_output = gr.Dataframe(**TABLE_CONFIG["search_table"])
     
+    page_outputs = [page_number, page_info, markdown_output, translation_output]
     submit_btn.click(
-        fn=process_pdf,
-        inputs=[pdf_input, api_key, enable_cache],
-        outputs=[summary_output, summary_charaters, markdown_output, translation_output],
+        fn=process_pdf_stream,
+        inputs=[pdf_input, api_key, enable_cache, analysis_mode],
+        outputs=[summary_output, summary_charaters, book_state, page_number, page_info, chapter_select, markdown_output, translation_output],
         show_progress=True
-    )
+    ).then(fn=show_page, inputs=[book_state, page_number], outputs=page_outputs)
+    prev_btn.click(fn=lambda book, page: show_page(book, (page or 1) - 1), inputs=[book_state, page_number], outputs=page_outputs)
+    next_btn.click(fn=lambda book, page: show_page(book, (page or 1) + 1), inputs=[book_state, page_number], outputs=page_outputs)
+    page_number.submit(fn=show_page, inputs=[book_state, page_number], outputs=page_outputs)
+    chapter_select.input(fn=show_chapter, inputs=[book_state, chapter_select], outputs=page_outputs)
+    search_btn.click(fn=search_books, inputs=search_input, outputs=search_output)
+    search_input.submit(fn=search_books, inputs=search_input, outputs=search_output)
     
     gr.Markdown("""
     ## 使用说明
@@ -59,4 +152,9 @@ with gr.Blocks(**THEME_CONFIG) as demo:
     """)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    # 界面启动的同时在后台加载PDF转换器
+    prewarm_converter()
     demo.launch()
\ No newline at end of file
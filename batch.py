@@ -0,0 +1,210 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional
+from config import ENABLE_CACHE, ANALYSIS_MODE, LOG_LEVEL, METRICS_PORT
+from database import get_pdf_cache, get_llm_cache
+from utils import convert_pdf_to_markdown, create_client, build_pipeline
+from metrics import job_report, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+class Manifest:
+    def __init__(self, path: str):
+        """记录每本书处理状态的清单文件，中断后重新运行时从上次的状态继续
+
+        状态依次为pending（待处理）、converted（已转换为Markdown）、done（已完成），失败时为failed。
+        """
+        self.path = path
+        self.books: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.books = json.load(f).get("books", {})
+
+    def get(self, name: str) -> Dict:
+        with self._lock:
+            return dict(self.books.get(name, {"status": "pending"}))
+
+    def update(self, name: str, **fields) -> None:
+        """更新一本书的状态并立即写入文件，先写临时文件再替换，避免中断时清单损坏"""
+        with self._lock:
+            record = self.books.setdefault(name, {"status": "pending"})
+            record.update(fields, updated_at=time.strftime("%Y-%m-%d %H:%M:%S"))
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"books": self.books}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+def find_pdfs(input_dir: str) -> List[str]:
+    """递归查找目录下的PDF文件，返回相对路径"""
+    pdfs = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.lower().endswith('.pdf'):
+                pdfs.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return sorted(pdfs)
+
+def output_path(output_dir: str, name: str, suffix: str) -> str:
+    """输出文件路径，保持输入目录的层级结构"""
+    path = os.path.join(output_dir, os.path.splitext(name)[0] + suffix)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def write_text(path: str, text: str) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text or "")
+
+def write_results(output_dir: str, name: str, md_content: Optional[str], chapter_data: List[List[str]], character_data: List[List[str]], translation: Optional[str]) -> None:
+    """将原文、译文和摘要写入输出目录，md_content为None时原文已在输出目录中"""
+    if md_content is not None:
+        write_text(output_path(output_dir, name, ".md"), md_content)
+    write_text(output_path(output_dir, name, ".zh.md"), translation)
+    with open(output_path(output_dir, name, ".summary.json"), 'w', encoding='utf-8') as f:
+        json.dump({"chapters": chapter_data, "characters": character_data}, f, ensure_ascii=False, indent=2)
+
+def convert_to_file(pdf_file: str, md_path: str, output_dir: str) -> str:
+    """在转换进程中将PDF转换为Markdown并直接写入文件，只返回文件路径，原文不经进程间管道传回"""
+    write_text(md_path, convert_pdf_to_markdown(pdf_file, output_dir))
+    return md_path
+
+def analyze(pdf_file: str, name: str, md_path: str, output_dir: str, api_key: Optional[str], enable_cache: bool, analysis_mode: str = ANALYSIS_MODE) -> None:
+    """读取已转换的Markdown执行摘要、人物志和翻译，并保存到缓存和输出目录，任务报告写入<name>.report.json"""
+    with open(md_path, 'r', encoding='utf-8') as f:
+        md_content = f.read()
+    with job_report(name) as report:
+        client = create_client(api_key)
+        graph = build_pipeline(client, pdf_file, output_dir, get_pdf_cache(), md_content,
+                               llm_cache=get_llm_cache() if enable_cache else None, analysis_mode=analysis_mode)
+        results = graph.run()
+        write_results(output_dir, name, None, results["chapter_summary"], results["character_summary"], results["translation"])
+        logger.info(f"[{name}] 处理完成，各阶段耗时：" + "，".join(f"{stage} {elapsed:.2f}秒" for stage, elapsed in graph.timings.items()))
+    with open(output_path(output_dir, name, ".report.json"), 'w', encoding='utf-8') as f:
+        json.dump(report.to_dict(), f, ensure_ascii=False, indent=2)
+
+def run_batch(input_dir: str, output_dir: str, manifest_path: str = None, convert_workers: int = None, llm_workers: int = 2,
+              api_key: Optional[str] = None, enable_cache: bool = ENABLE_CACHE, retry_failed: bool = False,
+              analysis_mode: str = ANALYSIS_MODE, prefetch: Optional[int] = None) -> Dict[str, int]:
+    """批量处理目录中的PDF文件
+
+    PDF转换受CPU限制，在进程池中执行；摘要和翻译以网络等待为主，在单独的线程池中执行，
+    每本书转换完成后立即进入分析阶段。同时处理中的图书不超过llm_workers + prefetch本，
+    转换结果写入文件后只传递路径，内存占用不随图书总数增长。
+
+    Args:
+        input_dir: PDF所在目录
+        output_dir: 输出目录
+        manifest_path: 清单文件路径，默认为输出目录下的manifest.json
+        convert_workers: PDF转换进程数，默认为CPU核数
+        llm_workers: 同时进行分析的图书数量
+        api_key: API密钥，默认为None
+        enable_cache: 是否使用缓存中已有的结果
+        retry_failed: 是否重新处理上次失败的图书
+        analysis_mode: 章节摘要和人物志的生成方式，"separate"或"combined"
+        prefetch: 转换可以领先分析的图书数量，默认为转换进程数
+
+    Returns:
+        Dict[str, int]: 各状态的图书数量
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(manifest_path or os.path.join(output_dir, "manifest.json"))
+    cache = get_pdf_cache()
+
+    llm_workers = max(1, llm_workers)
+    convert_workers = convert_workers or os.cpu_count() or 1
+    max_active = llm_workers + (prefetch if prefetch is not None else convert_workers)
+    llm_pool = ThreadPoolExecutor(max_workers=llm_workers)
+    convert_pool = ProcessPoolExecutor(max_workers=convert_workers)
+    # 进行中的任务：future -> (阶段, 书名)
+    active = {}
+    names = iter(find_pdfs(input_dir))
+
+    def submit_analysis(name: str, md_path: str):
+        future = llm_pool.submit(analyze, os.path.join(input_dir, name), name, md_path, output_dir, api_key, enable_cache, analysis_mode)
+        active[future] = ("analyze", name)
+
+    def fill():
+        """提交新的图书，直到进行中的图书达到上限或全部提交"""
+        while len(active) < max_active:
+            name = next(names, None)
+            if name is None:
+                return
+            record = manifest.get(name)
+            pdf_file = os.path.join(input_dir, name)
+            if record["status"] == "done" or (record["status"] == "failed" and not retry_failed):
+                continue
+
+            md5_hash = cache.calculate_md5(pdf_file)
+            entry = cache.get_entry(pdf_file) if enable_cache else None
+            if entry:
+                write_results(output_dir, name, entry.content, entry.chapter_data, entry.character_data, entry.translation)
+                manifest.update(name, status="done", md5=md5_hash, error=None)
+                logger.info(f"[{name}] 使用缓存结果")
+                continue
+
+            md_path = output_path(output_dir, name, ".md")
+            if record["status"] == "converted" and record.get("md5") == md5_hash and os.path.exists(md_path):
+                submit_analysis(name, md_path)
+                continue
+
+            manifest.update(name, status="pending", md5=md5_hash, error=None)
+            active[convert_pool.submit(convert_to_file, pdf_file, md_path, output_dir)] = ("convert", name)
+
+    try:
+        fill()
+        while active:
+            done, _ = wait(active, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, name = active.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    action = "PDF转换" if stage == "convert" else "处理"
+                    logger.error(f"[{name}] {action}失败：{str(e)}")
+                    manifest.update(name, status="failed", error=str(e))
+                    continue
+                if stage == "convert":
+                    manifest.update(name, status="converted")
+                    submit_analysis(name, result)
+                else:
+                    manifest.update(name, status="done")
+            fill()
+    finally:
+        convert_pool.shutdown(cancel_futures=True)
+        llm_pool.shutdown(cancel_futures=True)
+
+    counts: Dict[str, int] = {}
+    for record in manifest.books.values():
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+    logger.info(f"批量处理结束：{counts}")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="批量处理目录中的PDF图书：转换为Markdown，生成摘要、人物志和中文翻译")
+    parser.add_argument("input_dir", help="PDF所在目录，会递归查找子目录")
+    parser.add_argument("--output", default=os.path.join(os.getcwd(), "output"), help="输出目录，默认为output")
+    parser.add_argument("--manifest", default=None, help="清单文件路径，默认为输出目录下的manifest.json")
+    parser.add_argument("--convert-workers", type=int, default=None, help="PDF转换进程数，默认为CPU核数")
+    parser.add_argument("--llm-workers", type=int, default=2, help="同时进行摘要和翻译的图书数量，默认为2")
+    parser.add_argument("--api-key", default=None, help="OpenRouter API密钥，默认使用环境变量")
+    parser.add_argument("--no-cache", action="store_true", help="不使用缓存中已有的结果")
+    parser.add_argument("--retry-failed", action="store_true", help="重新处理上次失败的图书")
+    parser.add_argument("--analysis-mode", choices=["separate", "combined"], default=ANALYSIS_MODE,
+                        help="separate分别生成章节摘要和人物志，combined在同一次请求中生成，默认使用配置文件")
+    parser.add_argument("--prefetch", type=int, default=None, help="转换可以领先分析的图书数量，默认为转换进程数")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="指标服务端口，默认不启动")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    run_batch(args.input_dir, args.output, args.manifest, args.convert_workers, args.llm_workers,
+              args.api_key, not args.no_cache, args.retry_failed, args.analysis_mode, args.prefetch)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+WORDS = ("the", "river", "morning", "letter", "house", "quiet", "road", "window", "winter", "promise", "stranger",
+         "garden", "silver", "evening", "voice", "door", "memory", "city", "storm", "lamp", "harbor", "secret")
+CHARACTERS = ("Alice", "Bernard", "Clara", "Daniel", "Eleanor", "Felix")
+
+# 冷启动预算：模块 -> (导入耗时上限（秒）, 导入时不应加载的重量级依赖)
+# 界面必须依赖gradio，其余依赖都应在首次使用时才导入
+STARTUP_BUDGETS = {
+    "utils": (1.0, ("gradio", "openai", "markitdown")),
+    "batch": (1.0, ("gradio", "openai", "markitdown")),
+    "app": (8.0, ("openai", "markitdown")),
+}
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - start, "loaded": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+class FakeOpenAIServer:
+    def __init__(self, latency: float = 0.2, tokens_per_second: float = 500.0, rate_limit_ratio: float = 0.0,
+                 malformed_ratio: float = 0.0, retry_after: float = 1.0, max_output_tokens: int = 2000,
+                 seed: int = 0, host: str = "127.0.0.1", port: int = 0):
+        """本地模拟的OpenAI兼容接口，只实现/chat/completions
+
+        按系统提示词判断请求类型并返回结构正确的结果，可配置首字延迟、输出速度、
+        限流（429）比例和JSON格式错误比例，用于在不调用真实接口的情况下测量流水线的表现。
+
+        Args:
+            latency: 每个请求返回第一段内容前的等待时间（秒）
+            tokens_per_second: 输出速度，按字符数粗略估算token
+            rate_limit_ratio: 返回429的请求比例
+            malformed_ratio: 摘要类请求返回不完整JSON的比例
+            retry_after: 429响应中Retry-After的秒数
+            max_output_tokens: 单个响应的最大输出token数
+            seed: 随机数种子，相同参数下结果可重复
+            host: 监听地址
+            port: 监听端口，默认为0，由系统分配
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_ratio = rate_limit_ratio
+        self.malformed_ratio = malformed_ratio
+        self.retry_after = retry_after
+        self.max_output_tokens = max_output_tokens
+        self.stats = {"requests": 0, "rate_limited": 0, "malformed": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _FakeHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def roll(self, ratio: float) -> bool:
+        with self._lock:
+            return ratio > 0 and self._random.random() < ratio
+
+    def count(self, **values: int) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self.stats[key] += value
+
+    def reply(self, system_prompt: str, content: str) -> str:
+        """按请求类型生成响应内容"""
+        if "翻译" in system_prompt:
+            return "【译文】" + content[:self.max_output_tokens * 4]
+        if '"chapters"' in system_prompt:
+            return json.dumps({"chapters": self._chapters(system_prompt, content), "characters": self._characters(content)}, ensure_ascii=False)
+        if "人物" in system_prompt:
+            return json.dumps(self._characters(content), ensure_ascii=False)
+        if "各章节摘要" in system_prompt:
+            return "全书总结：" + content[:200]
+        return json.dumps(self._chapters(system_prompt, content), ensure_ascii=False)
+
+    @staticmethod
+    def _chapters(system_prompt: str, content: str) -> Dict[str, str]:
+        if "【" in system_prompt:
+            return {key: f"{key}的摘要。" for key in re.findall(r'^【(.+?)】$', content, re.M)}
+        titles = re.findall(r'^(?:#{1,3}\s*)?(Chapter \d+)', content, re.M)
+        result = {title: f"{title}的摘要。" for title in titles}
+        result["总结"] = "全书总结。"
+        return result
+
+    @staticmethod
+    def _characters(content: str) -> Dict[str, str]:
+        names = [name for name in CHARACTERS if name in content] or ["无名氏"]
+        return {name: f"{name}的背景、性格特点与人物关系简述。" for name in names}
+
+def estimate(text: str) -> int:
+    """按字符数粗略估算token数"""
+    return max(1, len(text) // 4)
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        fake: FakeOpenAIServer = self.server.fake
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        fake.count(requests=1)
+        if fake.roll(fake.rate_limit_ratio):
+            fake.count(rate_limited=1)
+            self._send_json(429, {"error": {"message": "rate limited", "code": 429}}, {"Retry-After": str(fake.retry_after)})
+            return
+
+        messages = body.get("messages", [])
+        system_prompt = next((m["content"] for m in messages if m["role"] == "system"), "")
+        content = messages[-1]["content"] if messages else ""
+        output = fake.reply(system_prompt, content)
+        if output.startswith("{") and fake.roll(fake.malformed_ratio):
+            fake.count(malformed=1)
+            output = "```json\n" + output[:-2]
+        usage = {"prompt_tokens": estimate(system_prompt + content), "completion_tokens": estimate(output)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        fake.count(prompt_tokens=usage["prompt_tokens"], completion_tokens=usage["completion_tokens"])
+
+        time.sleep(fake.latency)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "fake")
+        if not body.get("stream"):
+            time.sleep(usage["completion_tokens"] / fake.tokens_per_second)
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": output}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        piece = 80
+        for i in range(0, len(output), piece):
+            text = output[i:i + piece]
+            time.sleep(estimate(text) / fake.tokens_per_second)
+            self._send_event({"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                              "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]})
+        self._send_event({"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                          "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self._send_event({"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                          "choices": [], "usage": usage})
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+    def _send_json(self, status: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_event(self, data: Dict[str, Any]) -> None:
+        self._send_chunk(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def _send_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+def synthetic_pages(pages: int, pages_per_chapter: int = 5, lines_per_page: int = 45, seed: int = 0) -> List[List[str]]:
+    """生成合成图书的各页文本，每页带有页眉和页码，每隔pages_per_chapter页开始新的一章"""
+    rng = random.Random(seed)
+    result = []
+    for page in range(pages):
+        lines = ["THE SYNTHETIC NOVEL"]
+        if page % pages_per_chapter == 0:
+            lines.append(f"Chapter {page // pages_per_chapter + 1}")
+        while len(lines) < lines_per_page:
+            words = [rng.choice(WORDS) for _ in range(12)]
+            if rng.random() < 0.2:
+                words[rng.randrange(len(words))] = rng.choice(CHARACTERS)
+            lines.append(" ".join(words).capitalize() + ".")
+        lines.append(f"- {page + 1} -")
+        result.append(lines)
+    return result
+
+def write_pdf(path: str, pages: List[List[str]]) -> None:
+    """写入只包含文本的最小PDF文件，每个元素为一页的文本行"""
+    objects: List[bytes] = []
+    pages_id = 2 + 2 * len(pages)
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for lines in pages:
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        stream = ("BT /F1 11 Tf 14 TL 50 800 Td " + " ".join(f"({line}) '" for line in escaped) + " ET").encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 842] /Contents %d 0 R /Resources << /Font << /F1 1 0 R >> >> >>"
+                       % (pages_id, len(objects)))
+        page_ids.append(len(objects))
+    objects.append(b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % i for i in page_ids) + b"] /Count %d >>" % len(page_ids))
+    objects.append(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1) + b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, len(objects), xref)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def peak_rss_mb() -> Optional[float]:
+    """进程的峰值常驻内存（MB），不支持的平台返回None"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_case(server: FakeOpenAIServer, pdf_file: str, output_dir: str, enable_cache: bool, analysis_mode: str) -> Dict[str, Any]:
+    """端到端处理一个PDF文件并返回测量结果"""
+    from metrics import registry
+    from utils import process_pdf_file
+
+    before = dict(server.stats)
+    reports = len(registry.snapshot()["recent_jobs"])
+    start = time.perf_counter()
+    chapter_data, _, _, translation = process_pdf_file(pdf_file, output_dir, api_key="benchmark", enable_cache=enable_cache,
+                                                            analysis_mode=analysis_mode)
+    wall = time.perf_counter() - start
+    recent = registry.snapshot()["recent_jobs"]
+    report = recent[-1] if len(recent) > reports else {}
+
+    result = {key: server.stats[key] - before[key] for key in server.stats}
+    result.update({
+        "wall_seconds": round(wall, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "attempts": report.get("totals", {}).get("attempts", 0),
+        "stages": {name: round(seconds, 3) for name, seconds in report.get("stages", {}).items()},
+        "ok": bool(translation) and not (chapter_data and chapter_data[0][0] == "错误"),
+    })
+    return result
+
+def measure_startup(module: str, deferred: tuple, runs: int = 3) -> Dict[str, Any]:
+    """在全新的解释器中导入模块，测量导入耗时（取中位数）并检查加载了哪些应延迟导入的依赖
+
+    Args:
+        module: 模块名
+        deferred: 导入时不应加载的依赖
+        runs: 测量次数
+
+    Returns:
+        Dict[str, Any]: seconds导入耗时中位数，loaded实际被加载的依赖
+    """
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    work_dir = tempfile.mkdtemp(prefix="book-reader-startup-")
+    env = dict(os.environ, PYTHONPATH=project_dir, PYTHONWARNINGS="ignore",
+               CACHE_DB_PATH=os.path.join(work_dir, "cache.db"))
+    timings, loaded = [], set()
+    for _ in range(max(1, runs)):
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT.format(module=module, deferred=deferred)],
+                                cwd=work_dir, env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        loaded.update(result["loaded"])
+    return {"seconds": statistics.median(timings), "loaded": sorted(loaded)}
+
+def check_startup(runs: int = 3, budget_scale: float = 1.0) -> bool:
+    """检查各入口模块的冷启动耗时是否在预算之内，打印结果，全部通过时返回True"""
+    passed = True
+    for module, (budget, deferred) in STARTUP_BUDGETS.items():
+        result = measure_startup(module, deferred, runs)
+        limit = budget * budget_scale
+        ok = result["seconds"] <= limit and not result["loaded"]
+        passed = passed and ok
+        extra = f"  提前加载：{', '.join(result['loaded'])}" if result["loaded"] else ""
+        print(f"import {module:<6} {result['seconds']:>6.2f}s  预算 {limit:>5.2f}s  {'通过' if ok else '超出'}{extra}")
+    return passed
+
+def main():
+    parser = argparse.ArgumentParser(description="使用本地模拟接口和合成PDF对完整处理流程进行基准测试，不产生API费用")
+    parser.add_argument("--pages", default="5,20,80", help="合成PDF的页数，逗号分隔，默认为5,20,80")
+    parser.add_argument("--latency", type=float, default=0.2, help="每个请求的首字延迟（秒），默认为0.2")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0, help="模拟接口的输出速度，默认为500")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="返回429的请求比例，默认为0")
+    parser.add_argument("--malformed-ratio", type=float, default=0.0, help="摘要返回不完整JSON的比例，默认为0")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应中的Retry-After秒数，默认为1")
+    parser.add_argument("--rpm", type=int, default=None, help="覆盖客户端每个模型每分钟的请求数限制，默认使用配置文件")
+    parser.add_argument("--repeat", type=int, default=1, help="每个大小重复运行的次数，第二次起会命中缓存，默认为1")
+    parser.add_argument("--analysis-mode", choices=["separate", "combined"], default="separate", help="章节摘要和人物志的生成方式，默认为separate")
+    parser.add_argument("--no-cache", action="store_true", help="不使用缓存中已有的结果")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子，默认为0")
+    parser.add_argument("--json", default=None, help="将结果写入JSON文件")
+    parser.add_argument("--startup", action="store_true", help="只检查冷启动耗时是否在预算之内，超出时返回非零退出码")
+    parser.add_argument("--startup-runs", type=int, default=3, help="冷启动测量次数，取中位数，默认为3")
+    parser.add_argument("--startup-budget-scale", type=float, default=1.0, help="冷启动预算的倍数，用于较慢的机器，默认为1")
+    args = parser.parse_args()
+
+    if args.startup:
+        sys.exit(0 if check_startup(args.startup_runs, args.startup_budget_scale) else 1)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    server = FakeOpenAIServer(args.latency, args.tokens_per_second, args.rate_limit_ratio, args.malformed_ratio,
+                              args.retry_after, seed=args.seed).start()
+    work_dir = tempfile.mkdtemp(prefix="book-reader-bench-")
+    # 在导入项目模块之前设置，使接口地址和缓存数据库指向本地
+    os.environ["OPENROUTER_BASE_URL"] = server.url
+    os.environ["CACHE_DB_PATH"] = os.path.join(work_dir, "cache.db")
+
+    from ratelimit import rate_limiter
+    if args.rpm:
+        rate_limiter.limits = {"default": dict(rate_limiter.limits["default"], rpm=args.rpm)}
+
+    results = []
+    try:
+        for pages in [int(value) for value in args.pages.split(",") if value.strip()]:
+            pdf_file = os.path.join(work_dir, f"book_{pages}p.pdf")
+            write_pdf(pdf_file, synthetic_pages(pages, seed=args.seed))
+            for run in range(1, args.repeat + 1):
+                result = run_case(server, pdf_file, work_dir, not args.no_cache, args.analysis_mode)
+                result.update(pages=pages, run=run)
+                results.append(result)
+                stages = "，".join(f"{name} {seconds:.2f}s" for name, seconds in result["stages"].items()) or "-"
+                rss = f"{result['peak_rss_mb']:.0f}MB" if result["peak_rss_mb"] is not None else "-"
+                print(f"{pages:>5}页 #{run}  耗时 {result['wall_seconds']:>7.2f}s  请求 {result['requests']:>4}  "
+                      f"输入token {result['prompt_tokens']:>8}  "
+                      f"429 {result['rate_limited']:>3}  JSON错误 {result['malformed']:>3}  峰值内存 {rss:>6}  "
+                      f"{'成功' if result['ok'] else '失败'}  阶段：{stages}")
+    finally:
+        server.stop()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"settings": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
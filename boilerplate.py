@@ -0,0 +1,69 @@
+import logging
+import re
+from typing import Dict, List, Tuple
+from config import BOILERPLATE_EDGE_LINES, BOILERPLATE_MIN_PAGES, BOILERPLATE_MIN_RATIO
+from helpers import CHAPTER_PATTERN, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+PAGE_BREAK = '\x0c'
+DIGITS = re.compile(r'\d+')
+SPACES = re.compile(r'\s+')
+# 单独成行的页码，例如"12"、"- 12 -"、"Page 12 of 300"、"第12页"
+PAGE_NUMBER = re.compile(r'^[\s\-–—.·|]*(?:(?:page|p\.)\s*)?\d+(?:\s*(?:/|of)\s*\d+)?[\s\-–—.·|]*$|^第\s*\d+\s*页$', re.I)
+BLANK_RUN = re.compile(r'\n{3,}')
+TRAILING_SPACES = re.compile(r'[ \t]+$', re.M)
+
+def normalize_line(line: str) -> str:
+    """页眉页脚的比较键：忽略空白差异，数字统一替换，使"第3页"和"第4页"视为同一行"""
+    return DIGITS.sub('#', SPACES.sub(' ', line.strip()).lower())
+
+def edge_lines(lines: List[str], count: int) -> List[int]:
+    """页面开头和结尾各count个非空行的下标"""
+    non_empty = [i for i, line in enumerate(lines) if line.strip()]
+    return sorted(set(non_empty[:count] + non_empty[-count:]))
+
+def strip_boilerplate(text: str) -> Tuple[str, Dict[str, int]]:
+    """去除每页重复出现的页眉、页脚和页码，并规整空白
+
+    按分页符切分页面后，只检查每页开头和结尾的几行：规整后的内容在足够多的页面中重复出现，
+    或者是单独成行的页码时删除，正文中的重复句子不受影响。随后去掉行尾空格，
+    将连续的空行合并为一个。没有分页符时只规整空白。
+
+    Args:
+        text: convert_pdf_to_markdown的结果
+
+    Returns:
+        Tuple[str, Dict[str, int]]: 处理后的文本，以及统计信息
+            （removed_lines删除的行数、removed_chars删除的字符数、removed_tokens估算减少的token数、patterns识别出的重复行数）
+    """
+    pages = [page.split('\n') for page in text.split(PAGE_BREAK)]
+    # 只有一页时无法判断哪些行在各页重复
+    edges = [edge_lines(lines, BOILERPLATE_EDGE_LINES) if len(pages) > 1 else [] for lines in pages]
+
+    counts: Dict[str, int] = {}
+    for lines, indexes in zip(pages, edges):
+        for key in {normalize_line(lines[i]) for i in indexes}:
+            counts[key] = counts.get(key, 0) + 1
+    threshold = max(BOILERPLATE_MIN_PAGES, len(pages) * BOILERPLATE_MIN_RATIO)
+    repeated = {key for key, count in counts.items() if count >= threshold}
+
+    removed_lines = 0
+    kept_pages = []
+    for lines, indexes in zip(pages, edges):
+        # 章节标题可能恰好位于多页的开头，保留以便后续按章节切分
+        drop = {i for i in indexes if (normalize_line(lines[i]) in repeated or PAGE_NUMBER.match(lines[i]))
+                and not CHAPTER_PATTERN.match(lines[i].strip())}
+        removed_lines += len(drop)
+        kept_pages.append('\n'.join(line for i, line in enumerate(lines) if i not in drop))
+
+    cleaned = '\n'.join(kept_pages)
+    cleaned = BLANK_RUN.sub('\n\n', TRAILING_SPACES.sub('', cleaned)).strip() + '\n'
+    stats = {
+        "removed_lines": removed_lines,
+        "removed_chars": len(text) - len(cleaned),
+        "removed_tokens": estimate_tokens(text) - estimate_tokens(cleaned),
+        "patterns": len(repeated),
+    }
+    logger.info(f"去除页眉页脚{removed_lines}行（{len(repeated)}种重复行），减少{stats['removed_chars']}个字符，约{stats['removed_tokens']}个token")
+    return cleaned, stats
@@ -0,0 +1,98 @@
+from __future__ import annotations
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP_TIMEOUT, CLIENT_IDLE_TIMEOUT
+
+if TYPE_CHECKING:
+    # openai SDK导入较慢，创建第一个客户端时才导入
+    import httpx
+    from openai import OpenAI
+
+class ClientRegistry:
+    def __init__(self, max_connections: int = HTTP_MAX_CONNECTIONS, max_keepalive: int = HTTP_MAX_KEEPALIVE,
+                 keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY, timeout: float = HTTP_TIMEOUT,
+                 idle_timeout: float = CLIENT_IDLE_TIMEOUT):
+        """进程内共享的OpenAI客户端注册表
+
+        按(接口地址, API密钥)缓存OpenAI客户端，所有客户端共用同一个保持长连接的HTTP连接池，
+        多次上传和并发的翻译请求都复用已建立的TCP/TLS连接。可被多个线程同时使用。
+
+        Args:
+            max_connections: 连接池最大连接数
+            max_keepalive: 保持空闲长连接的最大数量
+            keepalive_expiry: 空闲长连接的保持时间（秒）
+            timeout: 单次请求的超时时间（秒）
+            idle_timeout: 客户端超过该时间未被使用时从注册表中移除（秒）
+        """
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._http_client: Optional[httpx.Client] = None
+        self._clients: Dict[Tuple[str, str], Tuple[OpenAI, float]] = {}
+        self._lock = threading.Lock()
+
+    def _get_http_client(self) -> httpx.Client:
+        """获取共享的HTTP客户端，首次调用时创建"""
+        if self._http_client is None:
+            import httpx
+            from openai import DefaultHttpxClient
+            self._http_client = DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry
+                )
+            )
+        return self._http_client
+
+    def get(self, base_url: str, api_key: str) -> OpenAI:
+        """获取指定接口地址和密钥对应的客户端，不存在时创建
+
+        Args:
+            base_url: API接口地址
+            api_key: API密钥
+
+        Returns:
+            OpenAI: 共享连接池的OpenAI客户端实例
+        """
+        key = (base_url, api_key)
+        with self._lock:
+            now = time.monotonic()
+            self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry is None:
+                from openai import OpenAI
+                # 重试、退避和模型切换统一由retry_api_call处理，关闭SDK自带的重试
+                client = OpenAI(
+                    base_url=base_url,
+                    api_key=api_key,
+                    max_retries=0,
+                    timeout=self.timeout,
+                    http_client=self._get_http_client()
+                )
+            else:
+                client = entry[0]
+            self._clients[key] = (client, now)
+            return client
+
+    def _evict_idle(self, now: float) -> None:
+        """移除长时间未使用的客户端
+
+        连接池由所有客户端共享，移除时不关闭客户端，仍在使用它的任务不受影响。
+        """
+        expired = [key for key, (_, last_used) in self._clients.items() if now - last_used > self.idle_timeout]
+        for key in expired:
+            del self._clients[key]
+
+    def close(self) -> None:
+        """关闭共享的连接池并清空注册表"""
+        with self._lock:
+            self._clients.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+
+client_registry = ClientRegistry()
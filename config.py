@@ -6,7 +6,14 @@ load_dotenv()
 
 # API配置
 API_KEY = os.getenv("OPENROUTER_API_KEY")
-API_BASE_URL = "https://openrouter.ai/api/v1"
+API_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# HTTP连接池配置
+HTTP_MAX_CONNECTIONS = 32  # 连接池最大连接数
+HTTP_MAX_KEEPALIVE = 16  # 保持的空闲长连接数
+HTTP_KEEPALIVE_EXPIRY = 60.0  # 空闲长连接保持时间（秒）
+HTTP_TIMEOUT = 600.0  # 单次请求超时时间（秒）
+CLIENT_IDLE_TIMEOUT = 1800.0  # 客户端超过该时间未使用时从注册表移除（秒）
 
 # 模型配置
 MODEL_NAMES = [
@@ -16,13 +23,75 @@ MODEL_NAMES = [
     "google/gemini-2.0-flash-exp:free"
 ]
 
+# 分片配置：按估算的token数切分文本
+CHUNK_TOKEN_TARGET = 7000  # 翻译时每个片段的目标token数，需为译文输出留出余量
+# 每个token对应的字符数，按模型名前缀匹配，未匹配时使用default
+TOKEN_RATIOS = {
+    "default": {"cjk": 1.0, "other": 4.0},
+    "google/gemini": {"cjk": 1.2, "other": 4.0},
+}
+
 # 摘要生成配置
 MAX_LENGTH = 1000000
 MAX_TOKENS = -1
-MAX_RETRY = 1
+MAX_RETRY = 1  # 摘要结果无法解析时重新请求的次数
+
+# 重试与限流配置
+MAX_API_ATTEMPTS = 6  # 单次API调用的最大尝试次数，失败的模型熔断后切换到MODEL_NAMES中的下一个模型
+# 每个模型每分钟的最大请求数和token数，未列出的模型使用default
+RATE_LIMITS = {
+    "default": {"rpm": 60, "tpm": 1000000},
+}
+BACKOFF_BASE = 1.0  # 指数退避的基础等待时间（秒）
+BACKOFF_MAX = 60.0  # 单次等待时间上限（秒）
+BREAKER_FAILURE_THRESHOLD = 3  # 模型连续失败多少次后熔断
+BREAKER_COOLDOWN = 60.0  # 熔断后跳过该模型的时间（秒）
+
+# 并发配置
+MAX_CONCURRENCY = 4  # 翻译时同时进行的最大请求数
+
+# 流式输出配置
+STREAM_INTERVAL = 0.5  # 两次界面更新之间的最小间隔（秒）
+
+# 阅读器配置
+VIEWER_PAGE_CHARS = 6000  # 原文每页的最大字符数，界面每次只传输一页
+
+# 全文搜索配置：原文和译文按片段建立FTS5索引，中日韩文字按单字分词
+SEARCH_PASSAGE_CHARS = 800  # 每个片段的最大字符数
+SEARCH_SNIPPET_CHARS = 80  # 结果摘录的最大字符数
+SEARCH_INDEX_BYTES_PER_TOKEN = 3  # 估算索引大小时每个词占用的字节数，索引大小计入缓存上限
+SEARCH_RESULT_LIMIT = 50  # 最多返回的结果数
+
+# 预处理配置：调用模型前去除每页重复的页眉、页脚和页码，缓存中仍保存原文
+ENABLE_BOILERPLATE_STRIP = True
+BOILERPLATE_EDGE_LINES = 3  # 每页开头和结尾各检查的行数
+BOILERPLATE_MIN_PAGES = 3  # 至少在多少页中重复出现才视为页眉页脚
+BOILERPLATE_MIN_RATIO = 0.3  # 至少在多大比例的页面中重复出现才视为页眉页脚
+
+# 章节摘要模式："map_reduce"按章节分组并发生成摘要后再汇总全文总结，"single"将全文一次性发送
+SUMMARY_MODE = "map_reduce"
+SUMMARY_GROUP_TOKENS = 30000  # map_reduce模式下每个请求包含的最大token数
+# 章节摘要和人物志的生成方式："separate"分别请求，"combined"在同一次请求中生成，全文只发送一遍
+ANALYSIS_MODE = "separate"
 
 # 缓存配置
 ENABLE_CACHE = True
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "pdf_cache.db")  # 缓存数据库路径
+CACHE_COMPRESSION_LEVEL = 6  # 原文和译文的zlib压缩级别
+CACHE_MAX_ENTRIES = 1000  # 最多缓存的图书数量，None表示不限制
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # 缓存数据的最大总字节数，None表示不限制；超出时淘汰最久未访问的图书
+LLM_CACHE_MAX_BYTES = 256 * 1024 ** 2  # 模型响应缓存压缩后的最大总字节数，None表示不限制；超出时淘汰最久未使用的响应
+FINGERPRINT_BUFFER_SIZE = 1024 * 1024  # 计算文件指纹时每次读取的字节数
+FINGERPRINT_MEMO_SIZE = 1024  # 按(路径, 大小, 修改时间, inode)缓存的文件指纹数量
+
+# 任务去重配置：同一文件同时只处理一次，其他请求等待并共享结果
+ENABLE_JOB_LOCK = True  # 通过缓存数据库中的锁记录，使同一台机器上的多个进程也不重复处理同一文件
+JOB_LOCK_TTL = 600.0  # 锁记录的有效期（秒），处理中的任务会定期续期
+JOB_LOCK_POLL = 5.0  # 等待其他进程时的检查间隔（秒）
+
+# 监控配置
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) or None  # 指标服务端口，提供/metrics和/metrics.json，None表示不启动
 
 # 系统提示词
 SYSTEM_PROMPTS = {
@@ -45,5 +114,51 @@ SYSTEM_PROMPTS = {
         "小明": "小明的背景、性格特点、书中人物关系、角色特点的简述..."
     }
     注意：简述的内容必须是中文，每个摘要的长度约为200字，返回信息必须是标准的json格式，不要带其他信息。
-    """
+    """,
+    "chapter_summary_map": """
+    你是一个专业的图书摘要生成助手，提供的内容包含一本书的若干章节，每个章节以【章节名】开头。请给每个章节生成中文简述，以json格式输出，键为【】中的章节名，格式如下：
+    {
+        "第1章": "第1章的摘要...",
+        "第2章": "第2章的摘要...",
+        ...
+    }
+    注意：摘要的内容要求是中文，每个摘要的长度约为200字，只输出提供的章节，返回信息必须是标准的json格式，不要带其他信息。
+    """,
+    "chapter_summary_reduce": """
+    你是一个专业的图书摘要生成助手，提供的内容是一本书按顺序排列的各章节摘要，请据此生成全文中文总结。
+    注意：总结的内容要求是中文，长度约为200字，直接输出总结正文，不要带其他信息。
+    """,
+    "combined_summary": """
+    你是一个专业的图书摘要生成助手，请对提供的内容同时完成两项任务：给每个章节生成中文简述以及全文中文总结；给每个人物生成中文的背景、性格特点、书中人物关系、角色特点的简述。以json格式输出，格式如下：
+    {
+        "chapters": {
+            "第1章": "第1章的摘要...",
+            "第2章": "第2章的摘要...",
+            ...,
+            "总结": "本书的全文摘要总结..."
+        },
+        "characters": {
+            "rose": "rose的背景、性格特点、书中人物关系、角色特点的简述...",
+            "小王": "小王的背景、性格特点、书中人物关系、角色特点的简述...",
+            ...
+        }
+    }
+    注意：内容要求是中文，每个摘要和简述的长度约为200字，返回信息必须是标准的json格式，不要带其他信息。
+    """,
+    "combined_summary_map": """
+    你是一个专业的图书摘要生成助手，提供的内容包含一本书的若干章节，每个章节以【章节名】开头。请同时完成两项任务：给每个章节生成中文简述，键为【】中的章节名；给这些章节中出现的每个人物生成中文的背景、性格特点、书中人物关系、角色特点的简述。以json格式输出，格式如下：
+    {
+        "chapters": {
+            "第1章": "第1章的摘要...",
+            "第2章": "第2章的摘要...",
+            ...
+        },
+        "characters": {
+            "rose": "rose的背景、性格特点、书中人物关系、角色特点的简述...",
+            ...
+        }
+    }
+    注意：内容要求是中文，每个摘要和简述的长度约为200字，只输出提供的章节，返回信息必须是标准的json格式，不要带其他信息。
+    """,
+    "translation": "你是一个专业的翻译助手，请将提供的内容翻译成中文，保持原文的格式和结构。"
 }
\ No newline at end of file
@@ -1,89 +1,583 @@
+import json
+import logging
+import os
 import sqlite3
 import hashlib
-from typing import Optional, Tuple, List
+import threading
+import time
+import zlib
+from typing import Optional, Tuple, List, Dict
+import search
+from fingerprint import file_fingerprint
+from metrics import record_cache_event
+from config import CACHE_DB_PATH, CACHE_COMPRESSION_LEVEL, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, LLM_CACHE_MAX_BYTES, SEARCH_RESULT_LIMIT
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """获取当前线程复用的数据库连接
+
+    每个线程对每个数据库文件只打开一个连接，并启用WAL模式，读写可以并发进行，
+    不再因回滚日志互相阻塞而出现"database is locked"。
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[db_path] = conn
+    return conn
+
+class CacheEntry:
+    def __init__(self, cache: 'PDFCache', md5_hash: str, chapter_data: List[List[str]], character_data: List[List[str]]):
+        """缓存中的一本书
+
+        摘要和人物志随记录一起读取，原文和译文在首次访问时才从数据库读取并解压。
+        """
+        self.cache = cache
+        self.md5_hash = md5_hash
+        self.chapter_data = chapter_data
+        self.character_data = character_data
+        self._payloads = {}
+
+    def _load(self, kind: str) -> Optional[str]:
+        if kind not in self._payloads:
+            self._payloads[kind] = self.cache.load_payload(self.md5_hash, kind)
+        return self._payloads[kind]
+
+    @property
+    def content(self) -> str:
+        """Markdown原文"""
+        return self._load("content") or ""
+
+    @property
+    def translation(self) -> Optional[str]:
+        """中文译文"""
+        return self._load("translation")
 
 class PDFCache:
-    def __init__(self, db_path: str = 'pdf_cache.db'):
-        """初始化PDF缓存数据库"""
+    def __init__(self, db_path: str = CACHE_DB_PATH, max_entries: Optional[int] = CACHE_MAX_ENTRIES, max_bytes: Optional[int] = CACHE_MAX_BYTES):
+        """初始化PDF缓存数据库
+
+        Args:
+            db_path: 数据库文件路径
+            max_entries: 最多缓存的图书数量，None表示不限制
+            max_bytes: 缓存数据的最大总字节数，None表示不限制；超出时按最近访问时间淘汰
+        """
         self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
         self._init_db()
     
     def _init_db(self):
-        """初始化数据库表结构"""
-        with sqlite3.connect(self.db_path) as conn:
+        """初始化数据库表结构，并迁移旧版pdf_cache表中的数据"""
+        with get_connection(self.db_path) as conn:
+            # 元数据与大字段分开存放，查询摘要时不必读取整本书
             conn.execute("""
-                CREATE TABLE IF NOT EXISTS pdf_cache (
+                CREATE TABLE IF NOT EXISTS books (
                     md5_hash TEXT PRIMARY KEY,
-                    content TEXT NOT NULL,
                     chapter_data TEXT NOT NULL,
                     character_data TEXT NOT NULL,
-                    translation TEXT,
+                    content_size INTEGER NOT NULL DEFAULT 0,
+                    translation_size INTEGER NOT NULL DEFAULT 0,
+                    stored_bytes INTEGER NOT NULL DEFAULT 0,
+                    last_accessed REAL NOT NULL DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(books)")}
+            if "stored_bytes" not in columns:
+                conn.execute("ALTER TABLE books ADD COLUMN stored_bytes INTEGER NOT NULL DEFAULT 0")
+                conn.execute("""
+                    UPDATE books SET stored_bytes = length(chapter_data) + length(character_data)
+                        + (SELECT COALESCE(SUM(length(data)), 0) FROM book_payloads p WHERE p.md5_hash = books.md5_hash)
+                """)
+            if "last_accessed" not in columns:
+                conn.execute("ALTER TABLE books ADD COLUMN last_accessed REAL NOT NULL DEFAULT 0")
+            # 全文索引的估算大小，已包含在stored_bytes中
+            if "search_bytes" not in columns:
+                conn.execute("ALTER TABLE books ADD COLUMN search_bytes INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_books_last_accessed ON books (last_accessed)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_locks (
+                    md5_hash TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS book_payloads (
+                    md5_hash TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (md5_hash, kind)
+                )
+            """)
+            search_created = search.create_tables(conn)
             conn.commit()
-    
+            legacy = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'pdf_cache'"
+            ).fetchone()
+        if legacy:
+            self._migrate_legacy()
+        if search_created:
+            self.rebuild_search_index()
+
+    def _migrate_legacy(self):
+        """将旧版pdf_cache表的未压缩数据迁移到books和book_payloads表"""
+        logger.info("检测到旧版缓存表，开始迁移")
+        with get_connection(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT md5_hash, content, chapter_data, character_data, translation, created_at FROM pdf_cache"
+            )
+            count = 0
+            for md5_hash, content, chapter_data, character_data, translation, created_at in rows.fetchall():
+                self._write(conn, md5_hash, content, chapter_data, character_data, translation, created_at)
+                count += 1
+            conn.execute("DROP TABLE pdf_cache")
+            conn.commit()
+        with get_connection(self.db_path) as conn:
+            conn.execute("VACUUM")
+        logger.info(f"旧版缓存迁移完成，共{count}条记录")
+
+    def rebuild_search_index(self) -> int:
+        """为缓存中的所有图书重建全文索引，旧记录没有文件名，以MD5前缀代替
+
+        Returns:
+            int: 建立索引的图书数量
+        """
+        with get_connection(self.db_path) as conn:
+            md5_hashes = [row[0] for row in conn.execute("SELECT md5_hash FROM books").fetchall()]
+        for md5_hash in md5_hashes:
+            with get_connection(self.db_path) as conn:
+                texts = self._load_texts(conn, md5_hash)
+                if texts is not None:
+                    self._index_book(conn, md5_hash, md5_hash[:8], texts)
+                conn.commit()
+        if md5_hashes:
+            logger.info(f"全文索引重建完成，共{len(md5_hashes)}本书")
+        return len(md5_hashes)
+
+    @staticmethod
+    def _load_texts(conn: sqlite3.Connection, md5_hash: str) -> Optional[Dict]:
+        """读取一本书的原文、译文、章节摘要和人物志，用于全文索引，记录不存在或无法读取时返回None"""
+        row = conn.execute("SELECT chapter_data, character_data FROM books WHERE md5_hash = ?", (md5_hash,)).fetchone()
+        if row is None:
+            return None
+        try:
+            texts = {"chapter": json.loads(row[0]), "character": json.loads(row[1])}
+            for kind, data in conn.execute(
+                "SELECT kind, data FROM book_payloads WHERE md5_hash = ? AND kind IN ('content', 'translation')", (md5_hash,)
+            ):
+                texts[kind] = zlib.decompress(data).decode('utf-8')
+            return texts
+        except Exception as e:
+            logger.warning(f"读取全文索引数据失败：{str(e)}")
+            return None
+
+    @staticmethod
+    def _index_book(conn: sqlite3.Connection, md5_hash: str, book: str, texts: Dict, old_texts: Optional[Dict] = None) -> None:
+        """更新一本书的全文索引，并将索引的估算大小计入stored_bytes，使缓存上限同样约束索引"""
+        search_bytes = search.index_book(conn, md5_hash, book, texts, old_texts)
+        conn.execute(
+            "UPDATE books SET stored_bytes = stored_bytes - search_bytes + ?, search_bytes = ? WHERE md5_hash = ?",
+            (search_bytes, search_bytes, md5_hash)
+        )
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, md5_hash: str, content: str, chapter_json: str, character_json: str, translation: Optional[str], created_at: str = None):
+        """写入一条记录，原文和译文压缩后存放"""
+        payloads = {
+            kind: zlib.compress(text.encode('utf-8'), CACHE_COMPRESSION_LEVEL)
+            for kind, text in (("content", content), ("translation", translation)) if text is not None
+        }
+        stored_bytes = len(chapter_json) + len(character_json) + sum(len(data) for data in payloads.values())
+        conn.execute("DELETE FROM book_payloads WHERE md5_hash = ?", (md5_hash,))
+        conn.execute(
+            "INSERT OR REPLACE INTO books (md5_hash, chapter_data, character_data, content_size, translation_size, stored_bytes, last_accessed, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))",
+            (md5_hash, chapter_json, character_json, len(content or ""), len(translation or ""), stored_bytes, time.time(), created_at)
+        )
+        conn.executemany(
+            "INSERT INTO book_payloads (md5_hash, kind, data) VALUES (?, ?, ?)",
+            [(md5_hash, kind, data) for kind, data in payloads.items()]
+        )
+
+    def _evict(self, conn: sqlite3.Connection, keep: str) -> int:
+        """按最近访问时间淘汰记录，直到条数和总字节数都不超过上限
+
+        Args:
+            conn: 数据库连接
+            keep: 不参与淘汰的记录（刚写入的图书）
+
+        Returns:
+            int: 淘汰的记录数
+        """
+        if self.max_entries is None and self.max_bytes is None:
+            return 0
+        entries, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(stored_bytes), 0) FROM books").fetchone()
+        evicted = []
+        rows = conn.execute("SELECT md5_hash, stored_bytes FROM books WHERE md5_hash != ? ORDER BY last_accessed", (keep,)).fetchall()
+        for md5_hash, stored_bytes in rows:
+            if (self.max_entries is None or entries <= self.max_entries) and (self.max_bytes is None or total_bytes <= self.max_bytes):
+                break
+            evicted.append(md5_hash)
+            entries -= 1
+            total_bytes -= stored_bytes
+        for md5_hash in evicted:
+            search.remove_book(conn, md5_hash, self._load_texts(conn, md5_hash))
+            conn.execute("DELETE FROM book_payloads WHERE md5_hash = ?", (md5_hash,))
+            conn.execute("DELETE FROM books WHERE md5_hash = ?", (md5_hash,))
+        if evicted:
+            logger.info(f"缓存超出上限，淘汰{len(evicted)}条最久未访问的记录")
+        return len(evicted)
+
     def calculate_md5(self, file_path: str) -> str:
-        """计算文件的MD5哈希值"""
+        """计算文件的MD5哈希值，同一文件未修改时直接返回上次的结果"""
         try:
-            hash_md5 = hashlib.md5()
-            print(f"开始计算文件MD5：{file_path}")
-            with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            md5_value = hash_md5.hexdigest()
-            print(f"文件MD5计算完成：{md5_value}")
-            return md5_value
+            return file_fingerprint(file_path)
         except Exception as e:
-            print(f"计算MD5哈希值失败：{str(e)}")
+            logger.error(f"计算MD5哈希值失败：{str(e)}")
             raise e
 
-    def get_cache(self, file_path: str) -> Optional[Tuple[str, List[List[str]], List[List[str]]]]:
-        """获取缓存的处理结果"""
-        print(f"尝试获取缓存，文件路径：{file_path}")
+    def get_entry(self, file_path: str) -> Optional[CacheEntry]:
+        """获取缓存记录，只读取摘要和人物志，原文和译文在访问时才加载"""
+        logger.debug(f"尝试获取缓存，文件路径：{file_path}")
         try:
             md5_hash = self.calculate_md5(file_path)
             if not md5_hash:
-                print("MD5计算失败，无法获取缓存")
+                logger.warning("MD5计算失败，无法获取缓存")
                 return None
 
-            print(f"查询数据库，MD5：{md5_hash}")
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
-                    "SELECT content, chapter_data, character_data, translation FROM pdf_cache WHERE md5_hash = ?",
+            logger.debug(f"查询数据库，MD5：{md5_hash}")
+            with get_connection(self.db_path) as conn:
+                result = conn.execute(
+                    "SELECT chapter_data, character_data FROM books WHERE md5_hash = ?",
                     (md5_hash,)
-                )
-                result = cursor.fetchone()
+                ).fetchone()
                 if result:
-                    print(f"找到缓存记录：{md5_hash}")
-                    import json
-                    content = result[0]
-                    chapter_data = json.loads(result[1])
-                    character_data = json.loads(result[2])
-                    translation = result[3]
-                    return content, chapter_data, character_data, translation
+                    conn.execute("UPDATE books SET last_accessed = ? WHERE md5_hash = ?", (time.time(), md5_hash))
+            with self._lock:
+                if result:
+                    self.hits += 1
                 else:
-                    print(f"未找到缓存记录：{md5_hash}")
-                return None
+                    self.misses += 1
+            record_cache_event("pdf", bool(result))
+            if result:
+                logger.info(f"找到缓存记录：{md5_hash}")
+                return CacheEntry(self, md5_hash, json.loads(result[0]), json.loads(result[1]))
+            logger.info(f"未找到缓存记录：{md5_hash}")
+            return None
         except Exception as e:
-            print(f"获取缓存失败：{str(e)}")
+            logger.error(f"获取缓存失败：{str(e)}")
             return None
+
+    def load_payload(self, md5_hash: str, kind: str) -> Optional[str]:
+        """读取并解压一本书的原文（content）或译文（translation）"""
+        try:
+            with get_connection(self.db_path) as conn:
+                result = conn.execute(
+                    "SELECT data FROM book_payloads WHERE md5_hash = ? AND kind = ?",
+                    (md5_hash, kind)
+                ).fetchone()
+            return zlib.decompress(result[0]).decode('utf-8') if result else None
+        except Exception as e:
+            logger.warning(f"读取缓存内容失败：{str(e)}")
+            return None
+
+    def get_cache(self, file_path: str) -> Optional[Tuple[str, List[List[str]], List[List[str]], Optional[str]]]:
+        """获取缓存的处理结果"""
+        entry = self.get_entry(file_path)
+        if entry is None:
+            return None
+        return entry.content, entry.chapter_data, entry.character_data, entry.translation
     
-    def save_cache(self, file_path: str, content: str, chapter_data: List[List[str]], character_data: List[List[str]], translation: str = None) -> bool:
-        """保存处理结果到缓存"""
+    def save_cache(self, file_path: str, content: str, chapter_data: List[List[str]], character_data: List[List[str]], translation: str = None, index: Optional[Dict] = None) -> bool:
+        """保存处理结果到缓存，index为阅读器使用的分页索引，同时更新这本书的全文索引"""
         try:
-            print(f"开始保存缓存，文件路径：{file_path}")
+            logger.debug(f"开始保存缓存，文件路径：{file_path}")
             md5_hash = self.calculate_md5(file_path)
-            #print(f"准备写入数据库，MD5：{md5_hash, content,chapter_data,character_data}")
-            with sqlite3.connect(self.db_path) as conn:
-                import json
+            with get_connection(self.db_path) as conn:
+                # 删除旧的全文索引需要旧数据，在覆盖之前读取
+                old_texts = self._load_texts(conn, md5_hash)
+                self._write(conn, md5_hash, content, json.dumps(chapter_data), json.dumps(character_data), translation)
+                if index is not None:
+                    self._write_index(conn, md5_hash, index)
+                texts = {"content": content, "translation": translation, "chapter": chapter_data, "character": character_data}
+                self._index_book(conn, md5_hash, os.path.basename(file_path), texts, old_texts)
+                self._evict(conn, md5_hash)
+                conn.commit()
+            logger.info(f"缓存保存成功：{md5_hash}")
+            return True
+        except Exception as e:
+            logger.error(f"保存缓存失败：{str(e)}")
+            return False
+
+    @staticmethod
+    def _write_index(conn: sqlite3.Connection, md5_hash: str, index: Dict) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO book_payloads (md5_hash, kind, data) VALUES (?, 'index', ?)",
+            (md5_hash, zlib.compress(json.dumps(index).encode('utf-8'), CACHE_COMPRESSION_LEVEL))
+        )
+
+    def save_index(self, md5_hash: str, index: Dict) -> bool:
+        """保存一本书的分页索引，与原文和译文一起存放并一起淘汰"""
+        try:
+            with get_connection(self.db_path) as conn:
+                if conn.execute("SELECT 1 FROM books WHERE md5_hash = ?", (md5_hash,)).fetchone():
+                    self._write_index(conn, md5_hash, index)
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.warning(f"保存分页索引失败：{str(e)}")
+            return False
+
+    def get_index(self, md5_hash: str) -> Optional[Dict]:
+        """读取一本书的分页索引，不存在时返回None"""
+        data = self.load_payload(md5_hash, "index")
+        return json.loads(data) if data else None
+
+    def search(self, query: str, limit: int = SEARCH_RESULT_LIMIT) -> List[Dict]:
+        """在所有缓存的原文、译文、章节摘要和人物志中搜索，按相关度排序"""
+        try:
+            with get_connection(self.db_path) as conn:
+                return search.search(conn, query, lambda md5_hash: self._load_texts(conn, md5_hash), limit)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"全文搜索失败：{str(e)}")
+            return []
+
+    def acquire_job_lock(self, md5_hash: str, owner: str, ttl: float) -> bool:
+        """尝试获取文件的处理锁，使同一台机器上的多个进程不重复处理同一文件
+
+        Args:
+            md5_hash: 文件指纹
+            owner: 锁持有者标识
+            ttl: 锁的有效期（秒），过期的锁视为已释放
+
+        Returns:
+            bool: 是否获得锁
+        """
+        try:
+            now = time.time()
+            with get_connection(self.db_path) as conn:
+                conn.execute("DELETE FROM job_locks WHERE md5_hash = ? AND expires_at < ?", (md5_hash, now))
+                conn.execute(
+                    "INSERT OR IGNORE INTO job_locks (md5_hash, owner, expires_at) VALUES (?, ?, ?)",
+                    (md5_hash, owner, now + ttl)
+                )
+                row = conn.execute("SELECT owner FROM job_locks WHERE md5_hash = ?", (md5_hash,)).fetchone()
+            return row is not None and row[0] == owner
+        except Exception as e:
+            logger.warning(f"获取处理锁失败：{str(e)}")
+            return True
+
+    def refresh_job_lock(self, md5_hash: str, owner: str, ttl: float) -> None:
+        """延长处理锁的有效期"""
+        try:
+            with get_connection(self.db_path) as conn:
+                conn.execute(
+                    "UPDATE job_locks SET expires_at = ? WHERE md5_hash = ? AND owner = ?",
+                    (time.time() + ttl, md5_hash, owner)
+                )
+        except Exception as e:
+            logger.warning(f"续期处理锁失败：{str(e)}")
+
+    def release_job_lock(self, md5_hash: str, owner: str) -> None:
+        """释放处理锁"""
+        try:
+            with get_connection(self.db_path) as conn:
+                conn.execute("DELETE FROM job_locks WHERE md5_hash = ? AND owner = ?", (md5_hash, owner))
+        except Exception as e:
+            logger.warning(f"释放处理锁失败：{str(e)}")
+
+    def stats(self) -> Dict[str, float]:
+        """返回缓存统计：记录数、数据字节数、数据库文件大小以及命中率"""
+        with get_connection(self.db_path) as conn:
+            entries, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(stored_bytes), 0) FROM books").fetchone()
+        file_bytes = sum(os.path.getsize(path) for path in (self.db_path, self.db_path + "-wal") if os.path.exists(path))
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "entries": entries,
+            "bytes": total_bytes,
+            "file_bytes": file_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+class LLMCache:
+    def __init__(self, db_path: str = CACHE_DB_PATH, max_bytes: Optional[int] = LLM_CACHE_MAX_BYTES):
+        """初始化模型响应缓存
+
+        以(模型, 系统提示词, 输入内容)的哈希为键缓存单次API调用的结果，
+        中断的任务重新执行时可以直接复用已完成的片段。响应压缩后存放，超出max_bytes时按最近使用时间淘汰。
+
+        Args:
+            db_path: 数据库文件路径
+            max_bytes: 压缩后响应的最大总字节数，None表示不限制
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.saved_prompt_tokens = 0
+        self.saved_completion_tokens = 0
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _init_db(self):
+        """初始化数据库表结构，旧版未压缩的响应压缩后迁移到新表"""
+        with get_connection(self.db_path) as conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(llm_cache)")}
+            if "response" in columns:
+                conn.execute("ALTER TABLE llm_cache RENAME TO llm_cache_legacy")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    stored_bytes INTEGER NOT NULL,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    last_accessed REAL NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed ON llm_cache (last_accessed)")
+            if "response" in columns:
+                rows = conn.execute(
+                    "SELECT cache_key, model, response, prompt_tokens, completion_tokens, created_at FROM llm_cache_legacy"
+                ).fetchall()
+                for cache_key, model, response, prompt_tokens, completion_tokens, created_at in rows:
+                    data = zlib.compress(response.encode('utf-8'), CACHE_COMPRESSION_LEVEL)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO llm_cache (cache_key, model, data, stored_bytes, prompt_tokens, completion_tokens, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (cache_key, model, data, len(data), prompt_tokens, completion_tokens, created_at)
+                    )
+                conn.execute("DROP TABLE llm_cache_legacy")
+                self._evict(conn)
+                logger.info(f"旧版响应缓存迁移完成，共{len(rows)}条记录")
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """按最近使用时间淘汰响应，直到总字节数不超过上限
+
+        Returns:
+            int: 淘汰的记录数
+        """
+        if self.max_bytes is None:
+            return 0
+        total_bytes = conn.execute("SELECT COALESCE(SUM(stored_bytes), 0) FROM llm_cache").fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return 0
+        evicted = []
+        for cache_key, stored_bytes in conn.execute("SELECT cache_key, stored_bytes FROM llm_cache ORDER BY last_accessed"):
+            if total_bytes <= self.max_bytes:
+                break
+            evicted.append((cache_key,))
+            total_bytes -= stored_bytes
+        conn.executemany("DELETE FROM llm_cache WHERE cache_key = ?", evicted)
+        logger.info(f"响应缓存超出上限，淘汰{len(evicted)}条最久未使用的记录")
+        return len(evicted)
+
+    @staticmethod
+    def make_key(model: str, system_prompt: Optional[str], content: str) -> str:
+        """计算缓存键"""
+        hash_obj = hashlib.sha256()
+        for part in (model, system_prompt or "", content):
+            hash_obj.update(part.encode('utf-8'))
+            hash_obj.update(b'\0')
+        return hash_obj.hexdigest()
+
+    def get(self, models: List[str], system_prompt: Optional[str], content: str) -> Optional[str]:
+        """按模型顺序查找缓存的响应
+
+        Args:
+            models: 候选模型列表，按优先级排列
+            system_prompt: 系统提示词
+            content: 输入内容
+
+        Returns:
+            str: 缓存的响应内容，未命中时返回None
+        """
+        try:
+            with get_connection(self.db_path) as conn:
+                for model in dict.fromkeys(models):
+                    cache_key = self.make_key(model, system_prompt, content)
+                    row = conn.execute(
+                        "SELECT data, prompt_tokens, completion_tokens FROM llm_cache WHERE cache_key = ?", (cache_key,)
+                    ).fetchone()
+                    if row:
+                        response = zlib.decompress(row[0]).decode('utf-8')
+                        conn.execute("UPDATE llm_cache SET last_accessed = ? WHERE cache_key = ?", (time.time(), cache_key))
+                        with self._lock:
+                            self.hits += 1
+                            self.saved_prompt_tokens += row[1] or 0
+                            self.saved_completion_tokens += row[2] or 0
+                        record_cache_event("llm", True)
+                        logger.info(f"命中响应缓存：{model}")
+                        return response
+        except Exception as e:
+            logger.warning(f"读取响应缓存失败：{str(e)}")
+        with self._lock:
+            self.misses += 1
+        record_cache_event("llm", False)
+        return None
+
+    def put(self, model: str, system_prompt: Optional[str], content: str, response: str, prompt_tokens: int = None, completion_tokens: int = None) -> bool:
+        """压缩保存单次API调用的响应，超出上限时淘汰最久未使用的响应"""
+        try:
+            data = zlib.compress(response.encode('utf-8'), CACHE_COMPRESSION_LEVEL)
+            with get_connection(self.db_path) as conn:
                 conn.execute(
-                    "INSERT OR REPLACE INTO pdf_cache (md5_hash, content, chapter_data, character_data, translation) VALUES (?, ?, ?, ?, ?)",
-                    (md5_hash, content, json.dumps(chapter_data), json.dumps(character_data), translation)
+                    "INSERT OR REPLACE INTO llm_cache (cache_key, model, data, stored_bytes, prompt_tokens, completion_tokens, last_accessed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.make_key(model, system_prompt, content), model, data, len(data), prompt_tokens, completion_tokens, time.time())
                 )
+                self._evict(conn)
                 conn.commit()
-            print(f"缓存保存成功：{md5_hash}")
             return True
         except Exception as e:
-            print(f"保存缓存失败：{str(e)}")
-            return False
\ No newline at end of file
+            logger.warning(f"保存响应缓存失败：{str(e)}")
+            return False
+
+    def stats(self) -> Dict[str, int]:
+        """返回记录数、压缩后的字节数、命中统计以及命中节省的token数"""
+        with get_connection(self.db_path) as conn:
+            entries, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(stored_bytes), 0) FROM llm_cache").fetchone()
+        with self._lock:
+            return {
+                "entries": entries,
+                "bytes": total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "saved_prompt_tokens": self.saved_prompt_tokens,
+                "saved_completion_tokens": self.saved_completion_tokens,
+            }
+
+_pdf_cache = None
+_llm_cache = None
+_cache_lock = threading.Lock()
+
+def get_pdf_cache() -> PDFCache:
+    """获取进程内共享的PDF缓存，命中统计在整个进程内累计"""
+    global _pdf_cache
+    with _cache_lock:
+        if _pdf_cache is None:
+            _pdf_cache = PDFCache()
+        return _pdf_cache
+
+def get_llm_cache() -> LLMCache:
+    """获取进程内共享的模型响应缓存，命中统计在整个进程内累计"""
+    global _llm_cache
+    with _cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache()
+        return _llm_cache
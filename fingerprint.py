@@ -0,0 +1,53 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Tuple
+from config import FINGERPRINT_BUFFER_SIZE, FINGERPRINT_MEMO_SIZE
+
+logger = logging.getLogger(__name__)
+
+_memo: "OrderedDict[Tuple[str, int, int, int], str]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+def _hash_file(file_path: str) -> str:
+    """以大缓冲区顺序读取文件并计算MD5，哈希计算期间释放GIL"""
+    hash_md5 = hashlib.md5()
+    buffer = bytearray(FINGERPRINT_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, 'rb', buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            hash_md5.update(view[:size])
+    return hash_md5.hexdigest()
+
+def file_fingerprint(file_path: str) -> str:
+    """计算文件指纹（MD5），与已有缓存记录的键保持一致
+
+    结果按(绝对路径, 文件大小, 修改时间, inode)缓存，同一文件在一次处理中只读取一遍，
+    文件被修改或替换后会重新计算。
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        str: 十六进制的MD5值
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+    with _memo_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+
+    logger.debug(f"开始计算文件MD5：{file_path}")
+    digest = _hash_file(file_path)
+    logger.debug(f"文件MD5计算完成：{digest}")
+    with _memo_lock:
+        _memo[key] = digest
+        while len(_memo) > FINGERPRINT_MEMO_SIZE:
+            _memo.popitem(last=False)
+    return digest
@@ -1,6 +1,19 @@
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
-from config import MODEL_NAMES, MAX_RETRY, MAX_TOKENS
+from __future__ import annotations
+import logging
+import math
+import re
+import time
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Callable, Tuple
+from config import MODEL_NAMES, MAX_API_ATTEMPTS, MAX_TOKENS, CHUNK_TOKEN_TARGET, TOKEN_RATIOS
+from database import LLMCache
+from ratelimit import rate_limiter, circuit_breaker, backoff_delay, get_status_code, get_retry_after
+from metrics import record_api_call
+from jsonrepair import MalformedJsonError
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+logger = logging.getLogger(__name__)
 
 def handle_openai_response(response: Any) -> Optional[str]:
     """处理OpenAI API的响应
@@ -20,90 +33,293 @@ def handle_openai_response(response: Any) -> Optional[str]:
     
     return content
 
-def retry_api_call(client: OpenAI, content: str, system_prompt: str = None) -> Optional[str]:
+def handle_stream_response(stream: Any, on_delta: Callable[[str], None]) -> Tuple[Optional[str], Any, Optional[str]]:
+    """处理OpenAI API的流式响应
+    
+    Args:
+        stream: stream=True时返回的响应分块迭代器
+        on_delta: 每收到一段内容时调用，参数为目前已收到的全部内容；抛出异常时中止读取
+        
+    Returns:
+        Tuple[Optional[str], Any, Optional[str]]: 响应内容（无效时为None）、token用量（未返回时为None）
+            以及结束原因finish_reason（未返回时为None）
+    """
+    content = ""
+    usage = None
+    finish_reason = None
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content
+            if delta:
+                content += delta
+                on_delta(content)
+    except Exception:
+        # on_delta抛出异常时中止请求，不再读取剩余的输出
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+        raise
+    
+    return (content or None), usage, finish_reason
+
+def retry_api_call(client: OpenAI, content: str, system_prompt: str = None, cache: Optional[LLMCache] = None, on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
     """使用重试机制调用OpenAI API
     
     Args:
         client: OpenAI客户端实例
         content: 需要处理的内容
         system_prompt: 系统提示词，默认为None
+        cache: 模型响应缓存，默认为None；提供时先查缓存，正常结束（finish_reason为"stop"）的响应写回缓存
+        on_delta: 流式输出回调，默认为None；提供时以stream=True请求，
+            每收到一段内容即以目前已收到的全部内容调用一次
         
     Returns:
         str: API调用结果
         
     Raises:
+        MalformedJsonError: on_delta判定输出格式错误并中止时直接抛出，不重试
         Exception: 当所有重试都失败时抛出异常
     """
-    for attempt in range(MAX_RETRY):
+    if cache is not None:
+        cached = cache.get(MODEL_NAMES, system_prompt, content)
+        if cached is not None:
+            if on_delta:
+                on_delta(cached)
+            return cached
+    
+    messages = [
+        {"role": "user", "content": content}
+    ]
+    if system_prompt:
+        messages.insert(0, {"role": "system", "content": system_prompt})
+    request_tokens = estimate_tokens(content) + estimate_tokens(system_prompt or "")
+    start = time.perf_counter()
+    
+    for attempt in range(MAX_API_ATTEMPTS):
+        model = circuit_breaker.pick(MODEL_NAMES)
+        rate_limiter.acquire(model, request_tokens)
         try:
-            messages = [
-                {"role": "user", "content": content}
-            ]
+            logger.debug(f"正在使用模型：{model}")
+            if on_delta:
+                stream = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=MAX_TOKENS,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                response = None
+                result, usage, finish_reason = handle_stream_response(stream, on_delta)
+            else:
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=MAX_TOKENS
+                )
+                result = handle_openai_response(response)
+                usage = getattr(response, "usage", None)
+                finish_reason = response.choices[0].finish_reason if result else None
             
-            if system_prompt:
-                messages.insert(0, {"role": "system", "content": system_prompt})
-            
-            print(f"正在使用模型：{MODEL_NAMES[attempt]}")
-            response = client.chat.completions.create(
-                model=MODEL_NAMES[attempt],
-                messages=messages,
-                max_tokens=MAX_TOKENS
-            )
-            
-            result = handle_openai_response(response)
             if result:
+                circuit_breaker.record_success(model)
+                prompt_tokens = getattr(usage, "prompt_tokens", None)
+                completion_tokens = getattr(usage, "completion_tokens", None)
+                record_api_call(model, time.perf_counter() - start, prompt_tokens, completion_tokens, attempt + 1, True)
+                # 因输出长度上限等原因被截断的响应不写入缓存，下次重新请求
+                if cache is not None and finish_reason == "stop":
+                    cache.put(model, system_prompt, content, result, prompt_tokens, completion_tokens)
                 return result
-            print(response)    
-            print(f"响应无效，尝试使用下一个模型：{MODEL_NAMES[attempt]}")
+            logger.debug(f"无效响应：{response}")
+            logger.warning(f"响应无效：{model}")
+            circuit_breaker.record_failure(model)
+            retry_after = None
             
+        except MalformedJsonError:
+            # 输出格式错误不代表模型不可用：不计入熔断、不退避，由调用方决定是否重新请求
+            record_api_call(model, time.perf_counter() - start, None, None, attempt + 1, False)
+            raise
         except Exception as e:
-            if attempt >= MAX_RETRY - 1:
+            status = get_status_code(e)
+            if status in (401, 403) or attempt >= MAX_API_ATTEMPTS - 1:
+                record_api_call(model, time.perf_counter() - start, None, None, attempt + 1, False)
                 raise Exception(f"API调用失败：{str(e)}")
-            print(f"调用失败，尝试使用下一个模型：{MODEL_NAMES[attempt]}，错误信息：{str(e)}")
+            circuit_breaker.record_failure(model)
+            retry_after = get_retry_after(e)
+            if status == 429:
+                rate_limiter.penalize(model, retry_after if retry_after is not None else backoff_delay(attempt))
+            logger.warning(f"调用失败：{model}，状态码：{status}，错误信息：{str(e)}")
+        
+        # 下一次仍使用同一模型时才需要退避，切换到其他模型可以立即重试
+        if attempt < MAX_API_ATTEMPTS - 1 and circuit_breaker.pick(MODEL_NAMES) == model:
+            delay = backoff_delay(attempt, retry_after)
+            logger.info(f"{delay:.1f}秒后重试")
+            time.sleep(delay)
             
+    record_api_call(model, time.perf_counter() - start, None, None, MAX_API_ATTEMPTS, False)
     raise Exception("处理超过最大重试次数")
 
-def split_content(text: str, max_length: int = 30000) -> List[str]:
-    """将文本按段落分割成不超过指定长度的片段
+CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+SENTENCE_BOUNDARY = re.compile(r'(?<=[。！？；…])|(?<=[.!?;])(?=\s)')
+PARAGRAPH_SEPARATOR = '\n\n'
+
+def token_ratios(model: str = None) -> Dict[str, float]:
+    """模型对应的字符/token比例，按TOKEN_RATIOS中最长的匹配前缀选择，默认为MODEL_NAMES中的第一个模型"""
+    model = model or MODEL_NAMES[0]
+    prefix = max((key for key in TOKEN_RATIOS if key != "default" and model.startswith(key)), key=len, default="default")
+    return TOKEN_RATIOS[prefix]
+
+def estimate_tokens(text: str, model: str = None) -> int:
+    """估算文本的token数
+    
+    中日韩字符与其他字符按TOKEN_RATIOS中不同的字符/token比例分别计算。
+    
+    Args:
+        text: 需要估算的文本
+        model: 模型名称，默认为MODEL_NAMES中的第一个
+        
+    Returns:
+        int: 估算的token数
+    """
+    ratios = token_ratios(model)
+    cjk = len(CJK_PATTERN.findall(text))
+    return math.ceil(cjk / ratios["cjk"] + (len(text) - cjk) / ratios["other"])
+
+def hard_split(text: str, max_tokens: int, model: str = None) -> List[str]:
+    """按长度切分没有句子边界的文本，逐字累加估算的token数，每段都不超过max_tokens
+    
+    中日韩字符和其他字符混排时各段的字符/token比例不同，不能按整段的平均比例计算步长。
+    """
+    ratios = token_ratios(model)
+    pieces = []
+    start = cjk = other = 0
+    for i, char in enumerate(text):
+        is_cjk = bool(CJK_PATTERN.match(char))
+        # 与estimate_tokens使用同样的公式，保证切出的每段估算结果都不超过预算
+        if i > start and math.ceil((cjk + is_cjk) / ratios["cjk"] + (other + (not is_cjk)) / ratios["other"]) > max_tokens:
+            pieces.append(text[start:i])
+            start, cjk, other = i, 0, 0
+        cjk += is_cjk
+        other += not is_cjk
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+def split_content(text: str, max_tokens: int = CHUNK_TOKEN_TARGET, model: str = None) -> List[str]:
+    """将文本按段落分割成不超过指定token数的片段
+    
+    按段落顺序一次遍历装箱，段落之间的分隔符也计入预算；超过预算的段落按句子边界拆分，
+    单个句子仍然超过预算时按长度硬切分。
     
     Args:
         text: 需要分割的文本
-        max_length: 每个片段的最大长度，默认为30000
+        max_tokens: 每个片段的最大token数，默认为CHUNK_TOKEN_TARGET
+        model: 用于估算token数的模型名称，默认为None
         
     Returns:
         List[str]: 分割后的文本片段列表
     """
-    paragraphs = text.split('\n\n')
+    separator_tokens = estimate_tokens(PARAGRAPH_SEPARATOR, model)
     chunks = []
     current_chunk = []
-    current_length = 0
-    
-    for para in paragraphs:
-        para_length = len(para)
-        if current_length + para_length <= max_length:
-            current_chunk.append(para)
-            current_length += para_length
-        else:
-            if current_chunk:
-                chunks.append('\n\n'.join(current_chunk))
-                print(f"当前片段长度：{current_length}")
-            current_chunk = [para]
-            current_length = para_length
+    current_tokens = 0
+    
+    def add(piece: str, tokens: int, separator: str) -> None:
+        nonlocal current_chunk, current_tokens
+        cost = tokens + (separator_tokens if separator and current_chunk else 0)
+        if current_chunk and current_tokens + cost > max_tokens:
+            chunks.append(''.join(current_chunk))
+            current_chunk, current_tokens = [], 0
+            cost = tokens
+        current_chunk.append(separator + piece if current_chunk else piece)
+        current_tokens += cost
+    
+    for para in text.split(PARAGRAPH_SEPARATOR):
+        para_tokens = estimate_tokens(para, model)
+        if para_tokens <= max_tokens:
+            add(para, para_tokens, PARAGRAPH_SEPARATOR)
+            continue
+        
+        separator = PARAGRAPH_SEPARATOR
+        for sentence in SENTENCE_BOUNDARY.split(para):
+            if not sentence:
+                continue
+            sentence_tokens = estimate_tokens(sentence, model)
+            if sentence_tokens <= max_tokens:
+                add(sentence, sentence_tokens, separator)
+            else:
+                for piece in hard_split(sentence, max_tokens, model):
+                    add(piece, estimate_tokens(piece, model), separator)
+                    separator = ''
+            separator = ''
     
     if current_chunk:
-        chunks.append('\n\n'.join(current_chunk))
+        chunks.append(''.join(current_chunk))
     
-    print(f"将文档切分为{len(chunks)}个片段")
+    logger.info(f"将文档切分为{len(chunks)}个片段")
     return chunks
 
+NUMBER_WORDS = (r'(?:one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|thirteen|fourteen|fifteen'
+                r'|sixteen|seventeen|eighteen|nineteen|twenty|thirty|forty|fifty|sixty|seventy|eighty|ninety|hundred)')
+# 英文标题必须是首字母大写或全大写的Chapter加数字、罗马数字或数字单词。编号后有分隔符
+# （"Chapter 1: The boy who lived"）时标题可以是任意大小写，只排除以逗号或分号结尾的行；
+# 没有分隔符时，PDF按行折断的正文（如"Chapter 3 was where she began, and"）以逗号、分号
+# 或小写单词结尾，不视为标题
+CHAPTER_PATTERN = re.compile(
+    r'^(?:#{1,3}\s*)?(?:'
+    rf'(?:Chapter|CHAPTER)\s+(?:\d+|[IVXLCDM]+|(?i:{NUMBER_WORDS}(?:-{NUMBER_WORDS})?))\b'
+    r"(?:\s*[:.\-–—](?!.*[,;]\s*$)|(?!\s*[:.\-–—])(?!.*(?:[,;]|(?<![A-Za-z'])[a-z][A-Za-z']*)\s*$))"
+    r'|第[0-9零一二三四五六七八九十百千两]+[章回]'
+    r')'
+)
+
+def split_chapters(text: str, max_title_length: int = 80) -> List[Tuple[str, str]]:
+    """按章节标题行切分文本
+    
+    识别"Chapter 3"、"CHAPTER IV"、"第十二章"等独占一行的章节标题，
+    第一个标题之前的内容（扉页、目录等）并入第一章。
+    
+    Args:
+        text: MarkItDown转换得到的文本
+        max_title_length: 标题行的最大长度，更长的行视为正文，默认为80
+        
+    Returns:
+        List[Tuple[str, str]]: [(章节标题, 章节内容)]，未识别到章节时返回空列表
+    """
+    starts = []
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if stripped and len(stripped) <= max_title_length and CHAPTER_PATTERN.match(stripped):
+            starts.append((offset, stripped.lstrip('#').strip()))
+        offset += len(line)
+    
+    if not starts:
+        return []
+    
+    chapters = []
+    for i, (start, title) in enumerate(starts):
+        begin = 0 if i == 0 else start
+        end = starts[i + 1][0] if i + 1 < len(starts) else len(text)
+        chapters.append((title, text[begin:end].strip()))
+    
+    logger.info(f"识别到{len(chapters)}个章节")
+    return chapters
+
 def update_progress(progress: Any, value: float, desc: str = None) -> None:
     """更新进度条
     
     Args:
-        progress: gradio的进度条对象
+        progress: gradio的进度条对象，为None时忽略
         value: 进度值（0-1之间）
         desc: 进度描述，默认为None
     """
+    if progress is None:
+        return
     if desc:
         progress(value, desc=desc)
     else:
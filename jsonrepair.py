@@ -0,0 +1,283 @@
+import json
+import logging
+import re
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 允许字符串中出现未转义的换行等控制字符，模型输出中很常见
+_decoder = json.JSONDecoder(strict=False)
+_WHITESPACE = re.compile(r'\s*')
+# 逗号之后的下一个键，用于在格式错误后重新对齐
+_NEXT_KEY = re.compile(r'\s*("(?:[^"\\\n]|\\.)*"\s*:)')
+_UNESCAPED_QUOTE = re.compile(r'(?<!\\)"')
+CODE_FENCE = re.compile(r'^\s*```[A-Za-z]*\s*$', re.M)
+
+class MalformedJsonError(ValueError):
+    """流式输出已经可以确定不是预期的JSON对象"""
+
+def find_object_start(text: str) -> int:
+    """第一个"{"的位置，可以跳过代码块标记和说明文字，找不到时返回-1"""
+    return text.find('{')
+
+def scan_object(text: str, start: int, pairs: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], int, str]:
+    """从start开始逐个解析JSON对象的顶层键值对
+
+    遇到格式错误的键值对（例如值中未转义的引号）时，跳到同一层级的下一个键继续解析，
+    不因一处错误丢弃后面的全部内容。
+
+    Args:
+        text: 文本
+        start: 开始解析的位置，为"{"的位置或上一次返回的位置
+        pairs: 上一次已解析出的键值对，与start配合用于增量解析
+
+    Returns:
+        Tuple[Dict[str, Any], int, str]:
+            - 已完整解析的键值对
+            - 最后一个完整键值对之后的位置，可作为下一次的start
+            - 状态："complete"对象已结束，"truncated"文本在对象中途结束，
+              "invalid"遇到格式错误且之后的文本中找不到可以继续解析的键
+    """
+    pairs = dict(pairs or {})
+    pos = start
+    if text.startswith('{', pos):
+        pos += 1
+    while True:
+        checkpoint = pos
+        pos = _WHITESPACE.match(text, pos).end()
+        # 容忍多余的逗号
+        while text.startswith(',', pos):
+            pos = _WHITESPACE.match(text, pos + 1).end()
+        if pos >= len(text):
+            return pairs, checkpoint, "truncated"
+        if text[pos] == '}':
+            return pairs, pos + 1, "complete"
+        pair_start = pos
+        key, value, pos, status = _scan_pair(text, pos)
+        if status == "truncated":
+            return pairs, checkpoint, "truncated"
+        if key is not None:
+            pairs[key] = value
+        if status == "invalid":
+            pos, found = _resync(text, pos)
+            if found == "none":
+                return pairs, checkpoint, "invalid"
+            delimiter = pos - 1 if found == "end" else text.rfind(',', pair_start, pos)
+            if isinstance(value, str):
+                pairs[key] = _recover_string(text, pair_start, delimiter) or value
+            if found == "end":
+                return pairs, pos, "complete"
+            logger.debug(f"跳过格式错误的内容：{text[pair_start:pos][:100]}")
+
+def _scan_pair(text: str, pos: int) -> Tuple[Optional[str], Any, int, str]:
+    """解析pos处的一个键值对
+
+    Returns:
+        Tuple[Optional[str], Any, int, str]: 键、值、解析停止的位置和状态（"ok"、"truncated"或"invalid"）；
+            值已完整但其后缺少分隔符时状态为"invalid"，仍返回键和值
+    """
+    if text[pos] != '"':
+        return None, None, pos, "invalid"
+    try:
+        key, pos = json.decoder.scanstring(text, pos + 1, False)
+    except json.JSONDecodeError as e:
+        return None, None, pos, "truncated" if _is_truncated(text, e) else "invalid"
+    pos = _WHITESPACE.match(text, pos).end()
+    if pos >= len(text):
+        return None, None, pos, "truncated"
+    if text[pos] != ':':
+        return None, None, pos, "invalid"
+    pos = _WHITESPACE.match(text, pos + 1).end()
+    if pos >= len(text):
+        return None, None, pos, "truncated"
+    try:
+        value, pos = _decoder.raw_decode(text, pos)
+    except json.JSONDecodeError as e:
+        if text[pos] != '{':
+            return None, None, pos, "truncated" if _is_truncated(text, e) else "invalid"
+        # 嵌套对象中有错误时递归解析，保留其中完整的键值对
+        value, pos, status = scan_object(text, pos)
+        if status == "invalid":
+            # 嵌套对象中已找不到可以继续解析的位置，外层也不能再从其中间对齐
+            return key, value, len(text), status
+        if status != "complete":
+            return None, value, pos, status
+    pos = _WHITESPACE.match(text, pos).end()
+    # 值之后还没有分隔符时，数字等值可能仍未输出完整
+    if pos >= len(text):
+        return None, None, pos, "truncated"
+    # 容忍键值对之间缺少逗号
+    if text[pos] not in ',}"':
+        return key, value, pos, "invalid"
+    return key, value, pos, "ok"
+
+def _resync(text: str, pos: int) -> Tuple[int, str]:
+    """从格式错误处向后查找同一层级的下一个键或对象的结尾
+
+    字符串可能正是出错的地方，因此只按括号计算层级，不区分是否在字符串中。
+
+    Returns:
+        Tuple[int, str]: ("pair"时为下一个键的位置，"end"时为对象结尾之后的位置, 结果)，找不到时结果为"none"
+    """
+    depth = 0
+    for i in range(pos, len(text)):
+        char = text[i]
+        if char in '{[':
+            depth += 1
+        elif char in '}]':
+            if depth == 0 and char == '}':
+                return i + 1, "end"
+            depth = max(depth - 1, 0)
+        elif char == ',' and depth == 0:
+            match = _NEXT_KEY.match(text, i + 1)
+            if match:
+                return match.start(1), "pair"
+    return pos, "none"
+
+def _recover_string(text: str, start: int, end: int) -> Optional[str]:
+    """字符串值中有未转义的引号时，将键之后到分隔符之前的全部内容作为这个值，无法恢复时返回None"""
+    try:
+        _, pos = json.decoder.scanstring(text, start + 1, False)
+    except json.JSONDecodeError:
+        return None
+    pos = _WHITESPACE.match(text, pos).end()
+    if not text.startswith(':', pos):
+        return None
+    raw = text[pos + 1:end].strip()
+    if len(raw) < 2 or raw[0] != '"' or raw[-1] != '"':
+        return None
+    try:
+        return _decoder.decode('"' + _UNESCAPED_QUOTE.sub(r'\\"', raw[1:-1]) + '"')
+    except json.JSONDecodeError:
+        return None
+
+def _is_truncated(text: str, error: json.JSONDecodeError) -> bool:
+    """解析错误是否只是因为文本在末尾被截断"""
+    return error.msg.startswith("Unterminated string") or error.pos >= len(text.rstrip())
+
+def _repair_truncated_value(text: str, pos: int) -> Optional[Tuple[str, Any]]:
+    """解析pos之后直到文本末尾的最后一个键值对：已结束的字符串值直接保留，被截断的字符串值补全引号，
+    对象值递归修复其中最后一个键值对"""
+    pos = _WHITESPACE.match(text, pos).end()
+    while text.startswith(',', pos):
+        pos = _WHITESPACE.match(text, pos + 1).end()
+    if not text.startswith('"', pos):
+        return None
+    try:
+        key, pos = json.decoder.scanstring(text, pos + 1, False)
+    except json.JSONDecodeError:
+        return None
+    pos = _WHITESPACE.match(text, pos).end()
+    if not text.startswith(':', pos):
+        return None
+    pos = _WHITESPACE.match(text, pos + 1).end()
+    if text.startswith('{', pos):
+        pairs, pos, status = scan_object(text, pos)
+        if status != "complete":
+            repaired = _repair_truncated_value(text, pos)
+            if repaired:
+                pairs[repaired[0]] = repaired[1]
+        return (key, pairs) if pairs else None
+    if not text.startswith('"', pos):
+        return None
+    # 只缺少对象结尾的"}"时字符串本身是完整的，直接保留
+    try:
+        value, end = json.decoder.scanstring(text, pos + 1, False)
+    except json.JSONDecodeError:
+        value = end = None
+    if end is not None and not CODE_FENCE.sub('', text[end:]).strip():
+        return (key, value) if value else None
+    rest = CODE_FENCE.sub('', text[pos + 1:]).rstrip()
+    # 去掉不完整的转义序列，转义值中的引号后补全引号
+    rest = re.sub(r'\\(u[0-9a-fA-F]{0,3})?$', '', rest)
+    try:
+        value = _decoder.decode('"' + _UNESCAPED_QUOTE.sub(r'\\"', rest) + '"')
+    except json.JSONDecodeError:
+        return None
+    return (key, value) if value else None
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """从模型输出中提取JSON对象
+
+    可以处理代码块包裹、前后带说明文字、多余的逗号以及在末尾被截断的输出。
+    无法完整解析时保留所有完整的键值对，被截断的最后一个字符串值补全后保留。
+
+    Args:
+        text: 模型输出
+
+    Returns:
+        Dict[str, Any]: 解析出的对象，没有任何可用的键值对时返回None
+    """
+    if not text:
+        return None
+    start = find_object_start(text)
+    if start < 0:
+        logger.warning(f"输出中没有JSON对象：{text[:200]}")
+        return None
+    try:
+        value, _ = _decoder.raw_decode(text, start)
+        if isinstance(value, dict):
+            return value
+    except json.JSONDecodeError:
+        pass
+
+    pairs, pos, status = scan_object(text, start)
+    # 最后一个值在末尾被截断，或其中有未转义的引号导致之后无法继续解析时，修复后保留
+    if status != "complete":
+        repaired = _repair_truncated_value(text, pos)
+        if repaired:
+            pairs[repaired[0]] = repaired[1]
+    if not pairs:
+        logger.warning(f"JSON解码失败：\n{text[:500]}")
+        return None
+    if status != "complete":
+        logger.warning(f"JSON不完整（{status}），保留已解析的{len(pairs)}项")
+    return pairs
+
+class StreamingJsonValidator:
+    def __init__(self, max_preamble: int = 200, check_interval: int = 256, max_invalid: int = 1000):
+        """在流式输出过程中检查JSON对象的结构，发现明显错误时中止请求
+
+        可作为retry_api_call的on_delta使用，只检查新增的部分，已完整解析的键值对不再重复解析。
+
+        Args:
+            max_preamble: 出现"{"之前允许的最大字符数
+            check_interval: 每新增多少个字符检查一次
+            max_invalid: 格式错误之后仍找不到下一个键时，最多再等待多少个字符
+        """
+        self.max_preamble = max_preamble
+        self.check_interval = check_interval
+        self.max_invalid = max_invalid
+        self.reset()
+
+    def reset(self) -> None:
+        self._start = -1
+        self._pos = 0
+        self._pairs: Dict[str, Any] = {}
+        self._checked = 0
+        self._complete = False
+
+    def __call__(self, text: str) -> None:
+        """检查目前收到的全部内容
+
+        Raises:
+            MalformedJsonError: 当输出明显不是JSON对象时抛出异常
+        """
+        if len(text) < self._checked:
+            # 重试后的新请求，重新开始检查
+            self.reset()
+        if self._complete or len(text) - self._checked < self.check_interval:
+            return
+        self._checked = len(text)
+        if self._start < 0:
+            self._start = find_object_start(text)
+            if self._start < 0:
+                if len(text.strip()) > self.max_preamble:
+                    raise MalformedJsonError(f"输出开头不是JSON对象：{text[:100]}")
+                return
+            self._pos = self._start
+        self._pairs, self._pos, status = scan_object(text, self._pos, self._pairs)
+        self._complete = status == "complete"
+        # 格式错误后可能随后出现下一个键，之后足够长的内容都无法继续解析时才中止
+        if status == "invalid" and len(text) - self._pos > self.max_invalid:
+            raise MalformedJsonError(f"JSON格式错误，位置{self._pos}：{text[self._pos:self._pos + 100]}")
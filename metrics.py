@@ -0,0 +1,204 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_current_report: contextvars.ContextVar[Optional["JobReport"]] = contextvars.ContextVar("job_report", default=None)
+
+class JobReport:
+    def __init__(self, name: str):
+        """一次处理任务的结构化报告：各阶段耗时、每次API调用和缓存命中情况
+
+        Args:
+            name: 任务名称，例如文件名或文件指纹
+        """
+        self.job_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.stages: Dict[str, float] = {}
+        self.api_calls: List[Dict[str, Any]] = []
+        self.cache_events: Dict[str, Dict[str, int]] = {}
+        self.preprocess: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化为JSON的字典"""
+        with self._lock:
+            calls = list(self.api_calls)
+            return {
+                "job_id": self.job_id,
+                "name": self.name,
+                "started_at": self.started_at,
+                "wall_seconds": (self.finished_at or time.time()) - self.started_at,
+                "stages": dict(self.stages),
+                "api_calls": calls,
+                "totals": {
+                    "requests": len(calls),
+                    "attempts": sum(call["attempts"] for call in calls),
+                    "prompt_tokens": sum(call["prompt_tokens"] or 0 for call in calls),
+                    "completion_tokens": sum(call["completion_tokens"] or 0 for call in calls),
+                },
+                "cache": {name: dict(events) for name, events in self.cache_events.items()},
+                "preprocess": dict(self.preprocess),
+            }
+
+class MetricsRegistry:
+    def __init__(self, keep_reports: int = 20):
+        """进程内的指标汇总，可导出为JSON或Prometheus文本格式
+
+        Args:
+            keep_reports: 保留的最近任务报告数量
+        """
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._help: Dict[str, str] = {}
+        self._reports: deque = deque(maxlen=keep_reports)
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, help_text: str = "", **labels: str) -> None:
+        """累加一个计数器"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def add_report(self, report: JobReport) -> None:
+        with self._lock:
+            self._reports.append(report)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回全部计数器以及最近任务的报告"""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            reports = list(self._reports)
+        return {"counters": counters, "recent_jobs": [report.to_dict() for report in reports]}
+
+    def to_prometheus(self) -> str:
+        """导出为Prometheus文本格式"""
+        with self._lock:
+            items = sorted(self._counters.items())
+            help_texts = dict(self._help)
+        lines = []
+        last_name = None
+        for (name, labels), value in items:
+            if name != last_name:
+                if name in help_texts:
+                    lines.append(f"# HELP {name} {help_texts[name]}")
+                lines.append(f"# TYPE {name} counter")
+                last_name = name
+            label_text = ",".join(f'{key}="{str(val)}"' for key, val in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+@contextmanager
+def job_report(name: str) -> Iterator[JobReport]:
+    """在当前上下文中记录一次任务，结束后加入最近任务列表并写入日志"""
+    report = JobReport(name)
+    token = _current_report.set(report)
+    try:
+        yield report
+    finally:
+        report.finished_at = time.time()
+        _current_report.reset(token)
+        registry.add_report(report)
+        registry.inc("book_reader_jobs_total", help_text="Processed jobs")
+        logger.info(f"任务报告：{json.dumps(report.to_dict(), ensure_ascii=False)}")
+
+def current_report() -> Optional[JobReport]:
+    """当前上下文中的任务报告，不在任务中时返回None"""
+    return _current_report.get()
+
+def bind_context(func: Callable) -> Callable:
+    """绑定当前上下文，使提交到线程池或新线程中的函数仍记录到同一个任务报告"""
+    context = contextvars.copy_context()
+    def run(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+def record_stage(stage: str, seconds: float) -> None:
+    """记录流水线阶段耗时"""
+    registry.inc("book_reader_stage_seconds_total", seconds, "Wall time spent per pipeline stage", stage=stage)
+    registry.inc("book_reader_stage_runs_total", 1, "Pipeline stage runs", stage=stage)
+    report = current_report()
+    if report:
+        with report._lock:
+            report.stages[stage] = report.stages.get(stage, 0.0) + seconds
+
+def record_api_call(model: str, seconds: float, prompt_tokens: Optional[int], completion_tokens: Optional[int], attempts: int, success: bool) -> None:
+    """记录一次API调用（包含其全部重试）的模型、耗时、token用量和尝试次数"""
+    status = "ok" if success else "error"
+    registry.inc("book_reader_api_calls_total", 1, "API calls", model=model, status=status)
+    registry.inc("book_reader_api_seconds_total", seconds, "API call latency including retries", model=model)
+    registry.inc("book_reader_api_retries_total", attempts - 1, "API call retries", model=model)
+    registry.inc("book_reader_prompt_tokens_total", prompt_tokens or 0, "Prompt tokens", model=model)
+    registry.inc("book_reader_completion_tokens_total", completion_tokens or 0, "Completion tokens", model=model)
+    report = current_report()
+    if report:
+        with report._lock:
+            report.api_calls.append({
+                "model": model,
+                "seconds": round(seconds, 3),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "attempts": attempts,
+                "success": success,
+            })
+
+def record_cache_event(cache: str, hit: bool) -> None:
+    """记录一次缓存查询的命中情况"""
+    event = "hit" if hit else "miss"
+    registry.inc("book_reader_cache_lookups_total", 1, "Cache lookups", cache=cache, result=event)
+    report = current_report()
+    if report:
+        with report._lock:
+            events = report.cache_events.setdefault(cache, {"hit": 0, "miss": 0})
+            events[event] += 1
+
+def record_preprocess(removed_chars: int, removed_tokens: int) -> None:
+    """记录预处理去除的字符数和估算的token数"""
+    registry.inc("book_reader_preprocess_removed_chars_total", removed_chars, "Characters removed before LLM calls")
+    registry.inc("book_reader_preprocess_removed_tokens_total", removed_tokens, "Estimated tokens removed before LLM calls")
+    report = current_report()
+    if report:
+        with report._lock:
+            report.preprocess = {"removed_chars": removed_chars, "removed_tokens": removed_tokens}
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = registry.to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(registry.snapshot(), ensure_ascii=False), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """在后台线程中启动指标服务：/metrics为Prometheus格式，/metrics.json为JSON快照"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"指标服务已启动：http://{host}:{port}/metrics")
+    return server
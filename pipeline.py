@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from metrics import bind_context, record_stage
+
+logger = logging.getLogger(__name__)
+
+class Stage:
+    def __init__(self, name: str, func: Callable[[Dict[str, Any], Callable], Any], deps: Sequence[str] = (), weight: float = 1.0, desc: str = None):
+        """流水线中的一个阶段
+
+        Args:
+            name: 阶段名称，同一流水线中唯一
+            func: 阶段函数，接收(已完成阶段的结果字典, 阶段进度函数)，返回阶段结果
+            deps: 依赖的阶段名称
+            weight: 该阶段在总进度中所占的份额
+            desc: 进度描述，默认为阶段名称
+        """
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.weight = weight
+        self.desc = desc or name
+
+class StageGraph:
+    def __init__(self, progress: Any = None, on_stage_done: Optional[Callable[[str, Any], None]] = None):
+        """按依赖关系并发执行各阶段的小型流水线
+
+        依赖全部完成的阶段会立即提交到线程池，因此没有相互依赖的分支并发执行，
+        总耗时约等于最慢的一条分支。
+
+        Args:
+            progress: gradio进度条对象，默认为None
+            on_stage_done: 阶段完成回调，参数为(阶段名称, 阶段结果)，可用于提前使用部分结果
+        """
+        self.progress = progress
+        self.on_stage_done = on_stage_done
+        self.stages: Dict[str, Stage] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}
+        self._fractions: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, func: Callable[[Dict[str, Any], Callable], Any], deps: Sequence[str] = (), weight: float = 1.0, desc: str = None) -> None:
+        """添加阶段
+
+        Args:
+            name: 阶段名称
+            func: 阶段函数
+            deps: 依赖的阶段名称，必须已经添加
+            weight: 总进度中的份额
+            desc: 进度描述
+
+        Raises:
+            ValueError: 当阶段重名或依赖不存在时抛出异常
+        """
+        if name in self.stages:
+            raise ValueError(f"阶段重复：{name}")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"阶段{name}依赖的阶段不存在：{dep}")
+        self.stages[name] = Stage(name, func, deps, weight, desc)
+
+    def _report(self, name: str, fraction: float, desc: str = None) -> None:
+        """记录阶段进度并更新总进度"""
+        with self._lock:
+            self._fractions[name] = min(max(fraction, 0.0), 1.0)
+            total_weight = sum(stage.weight for stage in self.stages.values()) or 1.0
+            value = sum(self.stages[n].weight * f for n, f in self._fractions.items()) / total_weight
+            if self.progress is not None:
+                self.progress(value, desc=desc or self.stages[name].desc)
+
+    def _stage_progress(self, name: str) -> Callable:
+        """生成只作用于单个阶段份额的进度函数，调用方式与gradio进度条相同"""
+        def progress(value: float, desc: str = None) -> None:
+            self._report(name, value, desc)
+        return progress
+
+    def _run_stage(self, stage: Stage) -> Any:
+        """执行单个阶段并记录耗时"""
+        self._report(stage.name, 0.0, f"{stage.desc}...")
+        start = time.perf_counter()
+        with self._lock:
+            deps = {dep: self.results[dep] for dep in stage.deps}
+        result = stage.func(deps, self._stage_progress(stage.name))
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.timings[stage.name] = elapsed
+        record_stage(stage.name, elapsed)
+        logger.info(f"阶段完成：{stage.name}，耗时{elapsed:.2f}秒")
+        return result
+
+    def run(self, max_workers: int = None) -> Dict[str, Any]:
+        """执行全部阶段
+
+        Args:
+            max_workers: 同时执行的最大阶段数，默认为阶段总数
+
+        Returns:
+            Dict[str, Any]: 各阶段的结果
+
+        Raises:
+            Exception: 任一阶段失败时取消尚未开始的阶段并抛出该异常
+        """
+        pending: List[str] = list(self.stages)
+        running = {}
+        executor = ThreadPoolExecutor(max_workers=max_workers or max(1, len(self.stages)))
+        try:
+            while pending or running:
+                for name in list(pending):
+                    if all(dep in self.results for dep in self.stages[name].deps):
+                        pending.remove(name)
+                        running[executor.submit(bind_context(self._run_stage), self.stages[name])] = name
+                if not running:
+                    raise ValueError(f"阶段依赖无法满足：{pending}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    result = future.result()
+                    with self._lock:
+                        self.results[name] = result
+                    self._report(name, 1.0)
+                    if self.on_stage_done:
+                        self.on_stage_done(name, result)
+        except Exception:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+        return self.results
@@ -0,0 +1,137 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+from config import RATE_LIMITS, BACKOFF_BASE, BACKOFF_MAX, BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    def __init__(self, limits: Dict[str, Dict[str, int]], window: float = 60.0):
+        """按模型限制一个时间窗口内的请求数和token数
+
+        Args:
+            limits: {模型名: {"rpm": 每窗口请求数, "tpm": 每窗口token数}}，未列出的模型使用"default"
+            window: 统计窗口长度（秒），默认为60
+        """
+        self.limits = limits
+        self.window = window
+        self._events: Dict[str, deque] = {}
+        self._blocked_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, model: str, tokens: int = 0) -> None:
+        """阻塞直到该模型的配额允许再发出一个请求
+
+        Args:
+            model: 模型名称
+            tokens: 本次请求预计消耗的token数
+        """
+        limit = self.limits.get(model, self.limits["default"])
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                events = self._events.setdefault(model, deque())
+                while events and events[0][0] <= now - self.window:
+                    events.popleft()
+                used_tokens = sum(t for _, t in events)
+                blocked_until = self._blocked_until.get(model, 0.0)
+                # 单个请求超过token配额时，等窗口清空后放行，避免永远阻塞
+                if now >= blocked_until and len(events) < limit["rpm"] and (not events or used_tokens + tokens <= limit["tpm"]):
+                    events.append((now, tokens))
+                    return
+                if now < blocked_until:
+                    # 限流暂停期间只等待暂停结束，配额未用完时不必等最早的请求移出窗口
+                    wait = blocked_until - now
+                else:
+                    wait = events[0][0] + self.window - now if events else 0.0
+            time.sleep(min(max(wait, 0.05), self.window))
+
+    def penalize(self, model: str, delay: float) -> None:
+        """收到限流响应后，在delay秒内暂停该模型的所有请求"""
+        with self._lock:
+            until = time.monotonic() + delay
+            self._blocked_until[model] = max(self._blocked_until.get(model, 0.0), until)
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, cooldown: float):
+        """按模型统计连续失败次数的熔断器
+
+        连续失败达到阈值后该模型在冷却时间内被跳过，冷却结束后放行请求试探，
+        试探成功即恢复，失败则重新进入冷却。
+
+        Args:
+            failure_threshold: 触发熔断的连续失败次数
+            cooldown: 熔断后的冷却时间（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def pick(self, models: List[str]) -> str:
+        """按优先级选择第一个可用的模型，全部熔断时选择最早恢复的模型"""
+        with self._lock:
+            now = time.monotonic()
+            candidates = list(dict.fromkeys(models))
+            for model in candidates:
+                if now >= self._open_until.get(model, 0.0):
+                    return model
+            return min(candidates, key=lambda model: self._open_until[model])
+
+    def record_success(self, model: str) -> None:
+        """记录一次成功调用"""
+        with self._lock:
+            self._failures[model] = 0
+            self._open_until.pop(model, None)
+
+    def record_failure(self, model: str) -> None:
+        """记录一次失败调用，连续失败达到阈值时熔断"""
+        with self._lock:
+            self._failures[model] = self._failures.get(model, 0) + 1
+            if self._failures[model] >= self.failure_threshold:
+                self._open_until[model] = time.monotonic() + self.cooldown
+                self._failures[model] = 0
+                logger.warning(f"模型连续失败，暂停使用{self.cooldown:.0f}秒：{model}")
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """从API异常中获取HTTP状态码，连接错误等没有状态码时返回None"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """从API异常的响应头中读取Retry-After（秒）"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """计算第attempt次失败后的等待时间
+
+    服务端给出Retry-After时以其为准，否则使用带完全随机抖动的指数退避，
+    避免大量并发请求在同一时刻重试。
+    """
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX) + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+rate_limiter = RateLimiter(RATE_LIMITS)
+circuit_breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN)
@@ -0,0 +1,201 @@
+import re
+import sqlite3
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from config import SEARCH_PASSAGE_CHARS, SEARCH_SNIPPET_CHARS, SEARCH_INDEX_BYTES_PER_TOKEN
+
+CJK_CHAR = re.compile(r'([⺀-鿿가-힯豈-﫿])')
+# 零宽空格在FTS5的unicode61分词器中是分隔符，用它把中日韩文字切成单字
+SEPARATOR = '​'
+WORD = re.compile(r'\w+')
+WHITESPACE = re.compile(r'\s+')
+PARAGRAPH = re.compile(r'(?:[^\n]*\S[^\n]*(?:\n|$))+')
+# 每个片段在search_passages中的大约开销（字节）
+PASSAGE_ROW_BYTES = 48
+
+def segment(text: str) -> str:
+    """中日韩文字逐字切分，其他文字保持不变，由FTS5按空格和标点分词"""
+    return CJK_CHAR.sub(rf'{SEPARATOR}\1{SEPARATOR}', text)
+
+def query_terms(query: str) -> List[str]:
+    """用户输入中的各个关键词，按空白分隔"""
+    return [term for term in (term.strip('"') for term in query.split()) if term]
+
+def build_query(query: str) -> Optional[str]:
+    """将用户输入转换为FTS5查询：每个词作为短语匹配，所有词都需要出现"""
+    terms = [f'"{segment(term.replace(chr(34), chr(34) * 2))}"' for term in query_terms(query)]
+    return ' AND '.join(terms) if terms else None
+
+def make_passages(text: str, max_chars: int = SEARCH_PASSAGE_CHARS) -> List[Tuple[int, str]]:
+    """将相邻段落合并为不超过max_chars个字符的片段，过长的段落按长度切开
+
+    Returns:
+        List[Tuple[int, str]]: (片段在文本中的起始位置, 片段)
+    """
+    passages = []
+    start = end = None
+    for match in PARAGRAPH.finditer(text):
+        if start is not None and match.end() - start > max_chars:
+            passages.append((start, text[start:end].rstrip()))
+            start = None
+        if start is None:
+            start = match.start()
+        end = match.end()
+        while end - start > max_chars:
+            passages.append((start, text[start:start + max_chars]))
+            start += max_chars
+    if start is not None and text[start:end].strip():
+        passages.append((start, text[start:end].rstrip()))
+    return passages
+
+def book_passages(texts: Dict[str, Any]) -> List[Tuple[str, Optional[str], int, int, str]]:
+    """一本书需要索引的全部片段
+
+    Args:
+        texts: {"content": 原文, "translation": 译文, "chapter": 章节摘要, "character": 人物志}
+
+    Returns:
+        List[Tuple[str, Optional[str], int, int, str]]: (类型, 标题或人名, 位置, 长度, 片段)；
+            原文和译文的位置为片段在文本中的起始位置，章节摘要和人物志的位置为条目序号
+    """
+    passages = []
+    for kind in ("content", "translation"):
+        for position, passage in make_passages(texts.get(kind) or ""):
+            passages.append((kind, None, position, len(passage), passage))
+    for kind in ("chapter", "character"):
+        for i, item in enumerate(texts.get(kind) or []):
+            if len(item) >= 2 and item[1]:
+                body = passage_text(texts, kind, i, 0)
+                passages.append((kind, str(item[0]), i, len(body), body))
+    return passages
+
+def passage_text(texts: Dict[str, Any], kind: str, position: int, length: int) -> str:
+    """按类型、位置和长度从原始数据中取出片段，索引中不保存片段本身"""
+    if kind in ("content", "translation"):
+        return (texts.get(kind) or "")[position:position + length]
+    items = texts.get(kind) or []
+    if position >= len(items) or len(items[position]) < 2:
+        return ""
+    return f"{items[position][0]}：{items[position][1]}"
+
+def create_tables(conn: sqlite3.Connection) -> bool:
+    """创建片段表和FTS5索引，返回是否为新建
+
+    FTS5使用无内容表（content=''），片段只以位置和长度记录，正文仍只在book_payloads中压缩保存一份。
+    旧版在片段表中保存了全文，检测到时删除后重建。
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(search_passages)")}
+    if "body" in columns:
+        conn.execute("DROP TABLE IF EXISTS search_fts")
+        conn.execute("DROP TABLE search_passages")
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'search_fts'").fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS search_passages (
+            id INTEGER PRIMARY KEY,
+            md5_hash TEXT NOT NULL,
+            book TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            label TEXT,
+            position INTEGER NOT NULL,
+            length INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_search_passages_md5 ON search_passages (md5_hash)")
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+            body, content='', tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    return not exists
+
+def remove_book(conn: sqlite3.Connection, md5_hash: str, texts: Optional[Dict[str, Any]]) -> None:
+    """删除一本书的全部片段
+
+    无内容表删除时需要提供写入时的原文，按记录的位置和长度从texts中取出。
+    texts为None时只删除片段记录，残留的词条不会再匹配到任何片段。
+    """
+    if texts is not None:
+        rows = conn.execute(
+            "SELECT id, kind, position, length FROM search_passages WHERE md5_hash = ?", (md5_hash,)
+        ).fetchall()
+        conn.executemany(
+            "INSERT INTO search_fts (search_fts, rowid, body) VALUES ('delete', ?, ?)",
+            [(rowid, segment(passage_text(texts, kind, position, length))) for rowid, kind, position, length in rows]
+        )
+    conn.execute("DELETE FROM search_passages WHERE md5_hash = ?", (md5_hash,))
+
+def index_book(conn: sqlite3.Connection, md5_hash: str, book: str, texts: Dict[str, Any],
+               old_texts: Optional[Dict[str, Any]] = None) -> int:
+    """重建一本书的索引：原文和译文按片段索引，章节摘要和人物志每条连同标题或人名作为一个片段
+
+    Args:
+        conn: 数据库连接
+        md5_hash: 文件指纹
+        book: 显示的书名
+        texts: 见book_passages
+        old_texts: 上一次建立索引时的数据，用于删除旧的片段
+
+    Returns:
+        int: 估算的索引占用字节数，计入缓存大小
+    """
+    remove_book(conn, md5_hash, old_texts)
+    index_bytes = 0
+    for kind, label, position, length, body in book_passages(texts):
+        body = segment(body)
+        cursor = conn.execute(
+            "INSERT INTO search_passages (md5_hash, book, kind, label, position, length) VALUES (?, ?, ?, ?, ?, ?)",
+            (md5_hash, book, kind, label, position, length)
+        )
+        conn.execute("INSERT INTO search_fts (rowid, body) VALUES (?, ?)", (cursor.lastrowid, body))
+        index_bytes += PASSAGE_ROW_BYTES + len(WORD.findall(body)) * SEARCH_INDEX_BYTES_PER_TOKEN
+    return index_bytes
+
+def make_snippet(text: str, terms: List[str], width: int = SEARCH_SNIPPET_CHARS) -> str:
+    """截取第一个关键词附近的width个字符作为摘录，关键词以**标出"""
+    text = WHITESPACE.sub(' ', text).strip()
+    pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.I) if terms else None
+    match = pattern.search(text) if pattern else None
+    start = max(0, match.start() - width // 3) if match else 0
+    end = min(len(text), start + width)
+    start = max(0, min(start, end - width))
+    snippet = text[start:end]
+    if pattern:
+        snippet = pattern.sub(lambda m: f"**{m.group(0)}**", snippet)
+    return ('…' if start > 0 else '') + snippet + ('…' if end < len(text) else '')
+
+def search(conn: sqlite3.Connection, query: str, load_texts: Callable[[str], Optional[Dict[str, Any]]],
+           limit: int = 20) -> List[Dict[str, Any]]:
+    """按相关度返回匹配的片段
+
+    Args:
+        conn: 数据库连接
+        query: 查询内容，多个词用空格分隔
+        load_texts: 按文件指纹读取一本书的数据（见book_passages），用于生成摘录
+        limit: 最多返回的结果数
+
+    Returns:
+        List[Dict[str, Any]]: 每条结果包含md5_hash、book、kind、label、position（原文和译文中的位置，
+            其他类型为None）和snippet（匹配处以**标出）
+    """
+    fts_query = build_query(query)
+    if not fts_query:
+        return []
+    rows = conn.execute("""
+        SELECT p.md5_hash, p.book, p.kind, p.label, p.position, p.length
+        FROM search_fts JOIN search_passages p ON p.id = search_fts.rowid
+        WHERE search_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    """, (fts_query, limit)).fetchall()
+    terms = query_terms(query)
+    books: Dict[str, Optional[Dict[str, Any]]] = {}
+    results = []
+    for md5_hash, book, kind, label, position, length in rows:
+        if md5_hash not in books:
+            books[md5_hash] = load_texts(md5_hash)
+        texts = books[md5_hash] or {}
+        results.append({
+            "md5_hash": md5_hash, "book": book, "kind": kind, "label": label,
+            "position": position if kind in ("content", "translation") else None,
+            "snippet": make_snippet(passage_text(texts, kind, position, length), terms),
+        })
+    return results
@@ -0,0 +1,103 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+class Flight:
+    def __init__(self):
+        """一次正在进行的任务，保存最新的进度和中间结果，供多个调用方共同等待"""
+        self._cond = threading.Condition()
+        self._version = 0
+        self._state = None
+        self._progress = (0.0, None)
+        self._done = False
+        self._error: Optional[Exception] = None
+        self._on_finish: Optional[Callable[[], None]] = None
+
+    def publish(self, state: Any = None, progress: Tuple[float, Optional[str]] = None) -> None:
+        """发布新的中间结果或进度
+
+        Args:
+            state: 当前的完整结果，默认为None表示不变
+            progress: (进度值, 进度描述)，默认为None表示不变
+        """
+        with self._cond:
+            if state is not None:
+                self._state = state
+            if progress is not None:
+                self._progress = progress
+            self._version += 1
+            self._cond.notify_all()
+
+    def finish(self, error: Exception = None) -> None:
+        """结束任务，error不为None时所有等待方都会收到该异常"""
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._version += 1
+            self._cond.notify_all()
+        if self._on_finish:
+            self._on_finish()
+
+    def subscribe(self, interval: float = 0.0) -> Iterator[Tuple[Tuple[float, Optional[str]], Any]]:
+        """逐步获取任务的进度和中间结果，直到任务结束
+
+        Args:
+            interval: 相邻两次返回的最小间隔（秒），期间的多次更新合并为一次
+
+        Yields:
+            Tuple[Tuple[float, Optional[str]], Any]: ((进度值, 进度描述), 当前的完整结果)
+
+        Raises:
+            Exception: 任务失败时抛出任务的异常
+        """
+        seen = -1
+        last_yield = 0.0
+        while True:
+            with self._cond:
+                while self._version == seen and not self._done:
+                    self._cond.wait()
+            time.sleep(max(0.0, last_yield + interval - time.monotonic()))
+            with self._cond:
+                seen = self._version
+                progress, state, done, error = self._progress, self._state, self._done, self._error
+            if done and error is not None:
+                raise error
+            if state is not None:
+                last_yield = time.monotonic()
+                yield progress, state
+            if done:
+                return
+
+class SingleFlight:
+    def __init__(self):
+        """按键合并进程内的重复任务：同一个键同时只执行一次，后来的调用方等待并共享其结果"""
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: Hashable, start: Callable[[Flight], None]) -> Tuple[Flight, bool]:
+        """加入键对应的任务，不存在时创建并启动
+
+        Args:
+            key: 任务键，例如文件指纹或(文件指纹, 处理选项)
+            start: 启动任务的函数，接收Flight，应在后台执行任务并在结束时调用Flight.finish
+
+        Returns:
+            Tuple[Flight, bool]: (任务, 是否由本次调用启动)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = Flight()
+            flight._on_finish = lambda: self._remove(key, flight)
+            self._flights[key] = flight
+        try:
+            start(flight)
+        except Exception as e:
+            flight.finish(e)
+        return flight, True
+
+    def _remove(self, key: Hashable, flight: Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
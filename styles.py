@@ -33,5 +33,13 @@ TABLE_CONFIG = {
         "col_count": (2, "fixed"),
         "wrap": True,
         "column_widths": ["25%", "75%"]
+    },
+    "search_table": {
+        "headers": ["书名", "类型", "位置", "摘录"],
+        "label": "搜索结果",
+        "col_count": (4, "fixed"),
+        "datatype": ["str", "str", "str", "markdown"],
+        "wrap": True,
+        "column_widths": ["20%", "10%", "15%", "55%"]
     }
 }
\ No newline at end of file
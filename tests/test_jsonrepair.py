@@ -0,0 +1,58 @@
+import pytest
+from jsonrepair import MalformedJsonError, StreamingJsonValidator, extract_json
+
+def test_complete_object_in_code_fence():
+    assert extract_json('说明\n```json\n{"第1章": "x"}\n```') == {"第1章": "x"}
+
+def test_missing_closing_brace_keeps_last_pair():
+    assert extract_json('{"第1章": "x", "总结": "全书总结"') == {"第1章": "x", "总结": "全书总结"}
+    assert extract_json('```json\n{"第1章": "x", "总结": "全书总结"\n```') == {"第1章": "x", "总结": "全书总结"}
+
+def test_truncated_string_is_completed():
+    assert extract_json('{"第1章": "x", "总结": "全书') == {"第1章": "x", "总结": "全书"}
+    assert extract_json('{"第1章": "x\\u4e') == {"第1章": "x"}
+
+def test_truncated_after_key_drops_pair():
+    assert extract_json('{"第1章": "x", "总结":') == {"第1章": "x"}
+
+def test_nested_truncation_keeps_complete_pairs():
+    text = '{"chapters": {"第1章": "a", "第2章": "b"}, "characters": {"甲": "c", "乙": "d'
+    assert extract_json(text) == {"chapters": {"第1章": "a", "第2章": "b"}, "characters": {"甲": "c", "乙": "d"}}
+    assert extract_json('{"chapters": {"第1章": "a"') == {"chapters": {"第1章": "a"}}
+
+def test_unescaped_quotes():
+    assert extract_json('{"a": "他说"你好"吧", "b": "y"}') == {"a": '他说"你好"吧', "b": "y"}
+    assert extract_json('{"a": "x", "b": "他说"你好') == {"a": "x", "b": '他说"你好'}
+
+def test_unescaped_quotes_in_nested_object():
+    text = '{"chapters": {"第1章": "a", "第2章": "他说"好'
+    assert extract_json(text) == {"chapters": {"第1章": "a", "第2章": '他说"好'}}
+    text = '{"chapters": {"第1章": "他说"好"}, "characters": {"甲": "c"}}'
+    assert extract_json(text) == {"chapters": {"第1章": '他说"好'}, "characters": {"甲": "c"}}
+
+def test_trailing_and_missing_commas():
+    assert extract_json('{"a": "x",, "b": "y",}') == {"a": "x", "b": "y"}
+    assert extract_json('{"a": "x" "b": "y"}') == {"a": "x", "b": "y"}
+
+def test_no_object():
+    assert extract_json("") is None
+    assert extract_json("抱歉，我无法完成") is None
+
+def test_validator_accepts_streamed_object():
+    validator = StreamingJsonValidator(check_interval=1)
+    text = '{"第1章": "' + "x" * 50 + '", "第2章": "y"}'
+    for end in range(1, len(text) + 1):
+        validator(text[:end])
+
+def test_validator_rejects_prose():
+    validator = StreamingJsonValidator(max_preamble=20, check_interval=1)
+    with pytest.raises(MalformedJsonError):
+        validator("这不是JSON，只是一段很长的说明文字，" * 3)
+
+def test_validator_waits_for_resync_before_aborting():
+    validator = StreamingJsonValidator(check_interval=1, max_invalid=50)
+    validator('{"a": "他说"你好"')
+    validator('{"a": "他说"你好", "b": "y"')
+    validator = StreamingJsonValidator(check_interval=1, max_invalid=50)
+    with pytest.raises(MalformedJsonError):
+        validator('{"a": 1 ' + "x" * 100)
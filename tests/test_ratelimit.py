@@ -0,0 +1,26 @@
+import time
+from ratelimit import RateLimiter
+
+def test_penalty_waits_only_for_retry_after():
+    limiter = RateLimiter({"default": {"rpm": 100, "tpm": 100000}})
+    limiter.acquire("m")
+    limiter.penalize("m", 0.2)
+    start = time.monotonic()
+    limiter.acquire("m")
+    elapsed = time.monotonic() - start
+    assert 0.15 <= elapsed < 1.0
+
+def test_exhausted_quota_waits_for_window():
+    limiter = RateLimiter({"default": {"rpm": 1, "tpm": 100000}}, window=0.3)
+    limiter.acquire("m")
+    start = time.monotonic()
+    limiter.acquire("m")
+    assert time.monotonic() - start >= 0.25
+
+def test_penalty_then_exhausted_quota_waits_for_window():
+    limiter = RateLimiter({"default": {"rpm": 1, "tpm": 100000}}, window=0.5)
+    limiter.acquire("m")
+    limiter.penalize("m", 0.1)
+    start = time.monotonic()
+    limiter.acquire("m")
+    assert time.monotonic() - start >= 0.45
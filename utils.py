@@ -1,20 +1,50 @@
-import json
+from __future__ import annotations
+import logging
 import os
-from typing import List, Dict, Any, Tuple, Optional
-from openai import OpenAI
-from markitdown import MarkItDown
-from config import API_KEY, API_BASE_URL, MODEL_NAMES, MAX_TOKENS, MAX_RETRY, SYSTEM_PROMPTS, MAX_LENGTH
-import gradio as gr
-from database import PDFCache
-from helpers import split_content, retry_api_call, update_progress
-
-def translate_content(client: OpenAI, content: str, progress: Any) -> str:
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, List, Dict, Any, Tuple, Optional, Callable, Iterator
+from config import API_KEY, API_BASE_URL, MODEL_NAMES, MAX_TOKENS, MAX_RETRY, SYSTEM_PROMPTS, MAX_LENGTH, MAX_CONCURRENCY, STREAM_INTERVAL, SUMMARY_MODE, SUMMARY_GROUP_TOKENS, ANALYSIS_MODE, ENABLE_BOILERPLATE_STRIP, CHUNK_TOKEN_TARGET, ENABLE_JOB_LOCK, JOB_LOCK_TTL, JOB_LOCK_POLL
+from database import PDFCache, CacheEntry, LLMCache, get_pdf_cache, get_llm_cache
+from helpers import split_content, split_chapters, estimate_tokens, retry_api_call, update_progress
+from pipeline import StageGraph
+from clients import client_registry
+from singleflight import Flight, SingleFlight
+from metrics import job_report, bind_context, record_preprocess
+from boilerplate import strip_boilerplate
+from viewer import build_index
+from jsonrepair import extract_json, StreamingJsonValidator, MalformedJsonError
+
+if TYPE_CHECKING:
+    # openai和markitdown导入较慢，首次使用时才导入，缩短服务的启动时间
+    from openai import OpenAI
+    from markitdown import MarkItDown
+
+logger = logging.getLogger(__name__)
+
+# 进程内正在处理的任务，按文件指纹和处理选项去重
+job_flights = SingleFlight()
+
+_converter: Optional[MarkItDown] = None
+_converter_lock = threading.Lock()
+
+def translate_content(client: OpenAI, content: str, progress: Any, max_workers: int = MAX_CONCURRENCY, cache: Optional[LLMCache] = None, on_update: Optional[Callable[[str], None]] = None) -> str:
     """将内容翻译成中文
     
+    各片段在线程池中并发翻译，同时进行的请求数不超过max_workers，
+    结果按原文片段顺序合并。任一片段最终失败时取消其余未开始的片段。
+    提供响应缓存时已翻译过的片段直接复用，失败后重新执行会从缺失的片段继续。
+    
     Args:
         client: OpenAI客户端实例
         content: 需要翻译的内容
-        progress: gradio进度条对象
+        progress: 进度函数，接收0-1之间的翻译完成比例
+        max_workers: 最大并发请求数，默认为MAX_CONCURRENCY
+        cache: 模型响应缓存，默认为None
+        on_update: 流式更新回调，默认为None；提供时以流式请求翻译，
+            参数为按原文顺序已连续完成的译文加上下一个片段目前收到的部分
         
     Returns:
         str: 翻译后的中文内容
@@ -22,34 +52,68 @@ def translate_content(client: OpenAI, content: str, progress: Any) -> str:
     Raises:
         Exception: 当翻译失败时抛出异常
     """
-    if len(content) <= 30000:
-        return retry_api_call(
-            client,
-            content,
-            "你是一个专业的翻译助手，请将提供的内容翻译成中文，保持原文的格式和结构。"
-        )
+    if estimate_tokens(content) <= CHUNK_TOKEN_TARGET:
+        return retry_api_call(client, content, SYSTEM_PROMPTS["translation"], cache, on_update)
     
     content_chunks = split_content(content)
     total_chunks = len(content_chunks)
-    translations = []
+    translations = [None] * total_chunks
+    partials = [""] * total_chunks
+    finished = 0
+    # 按原文顺序已连续完成的片段数及其合并结果
+    ordered = {"count": 0, "text": ""}
+    lock = threading.Lock()
     
-    for i, chunk in enumerate(content_chunks):
-        print(f"正在翻译第{i + 1}/{total_chunks}个片段...")
-        update_progress(progress, 0.5 + (i + 1)/total_chunks/2, "正在翻译...")
-        
-        translation = retry_api_call(
-            client,
-            chunk,
-            "你是一个专业的翻译助手，请将提供的内容翻译成中文，保持原文的格式和结构。"
-        )
-        translations.append(translation)
-        print(f"第{i + 1}/{total_chunks}个片段翻译完成")
+    def publish():
+        if not on_update:
+            return
+        text = ordered["text"]
+        if ordered["count"] < total_chunks and partials[ordered["count"]]:
+            text = text + ('\n\n' if text else '') + partials[ordered["count"]]
+        on_update(text)
+    
+    def make_on_delta(i):
+        def on_delta(text):
+            with lock:
+                partials[i] = text
+                if i == ordered["count"]:
+                    publish()
+        return on_delta
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    futures = {
+        executor.submit(bind_context(retry_api_call), client, chunk, SYSTEM_PROMPTS["translation"], cache,
+                        make_on_delta(i) if on_update else None): i
+        for i, chunk in enumerate(content_chunks)
+    }
+    logger.info(f"开始并发翻译{total_chunks}个片段，最大并发数：{max_workers}")
+    try:
+        for future in as_completed(futures):
+            i = futures[future]
+            translations[i] = future.result()
+            finished += 1
+            with lock:
+                while ordered["count"] < total_chunks and translations[ordered["count"]] is not None:
+                    ordered["text"] += ('\n\n' if ordered["count"] else '') + translations[ordered["count"]]
+                    ordered["count"] += 1
+                publish()
+            update_progress(progress, finished/total_chunks, f"正在翻译（{finished}/{total_chunks}）")
+            logger.info(f"第{i + 1}/{total_chunks}个片段翻译完成（已完成{finished}/{total_chunks}）")
+    except Exception:
+        logger.error(f"片段翻译失败，取消剩余{total_chunks - finished}个片段")
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
     
-    print("所有片段翻译完成，正在合并结果...")
+    if cache is not None:
+        logger.info(f"响应缓存统计：{cache.stats()}")
+    logger.info("所有片段翻译完成，正在合并结果...")
     return '\n\n'.join(translations)
 
 def create_client(api_key: Optional[str] = None) -> OpenAI:
-    """创建OpenAI客户端
+    """获取OpenAI客户端
+    
+    同一接口地址和密钥返回进程内共享的客户端，HTTP连接在多次处理之间复用。
     
     Args:
         api_key: API密钥，默认为None，将使用配置文件中的密钥
@@ -57,10 +121,37 @@ def create_client(api_key: Optional[str] = None) -> OpenAI:
     Returns:
         OpenAI: OpenAI客户端实例
     """
-    return OpenAI(
-        base_url=API_BASE_URL,
-        api_key=api_key or API_KEY
-    )
+    return client_registry.get(API_BASE_URL, api_key or API_KEY)
+
+def get_converter() -> MarkItDown:
+    """获取进程内共享的MarkItDown实例，首次调用时导入markitdown并创建
+
+    转换器本身不保存单次转换的状态，可被多个线程同时使用，不必每次转换都重新创建。
+    """
+    global _converter
+    with _converter_lock:
+        if _converter is None:
+            from markitdown import MarkItDown
+            _converter = MarkItDown()
+        return _converter
+
+def prewarm_converter() -> threading.Thread:
+    """在后台线程中创建共享的转换器，服务启动后第一次上传不必等待markitdown及其PDF依赖加载
+
+    Returns:
+        threading.Thread: 执行预热的后台线程
+    """
+    def warm():
+        try:
+            start = time.perf_counter()
+            get_converter()
+            logger.info(f"PDF转换器预热完成，耗时{time.perf_counter() - start:.2f}秒")
+        except Exception as e:
+            logger.warning(f"PDF转换器预热失败：{str(e)}")
+
+    thread = threading.Thread(target=warm, name="converter-prewarm", daemon=True)
+    thread.start()
+    return thread
 
 def convert_pdf_to_markdown(pdf_file: str, output_dir: str) -> str:
     """将PDF转换为Markdown格式
@@ -78,7 +169,7 @@ def convert_pdf_to_markdown(pdf_file: str, output_dir: str) -> str:
     if pdf_file is None:
         raise ValueError("PDF文件不能为空")
     
-    md_content = MarkItDown().convert(pdf_file)
+    md_content = get_converter().convert(pdf_file)
     if md_content is None:
         raise ValueError("PDF转换失败，请检查文件格式")
     
@@ -87,37 +178,16 @@ def convert_pdf_to_markdown(pdf_file: str, output_dir: str) -> str:
 def decode_json(json_str: str) -> Optional[Dict]:
     """解码JSON字符串
     
+    可以处理代码块包裹、带说明文字和末尾被截断的输出，无法完整解析时保留已完整的键值对。
+    
     Args:
         json_str: JSON字符串
         
     Returns:
         Dict: 解析后的JSON对象，解析失败时返回None
     """
-    json_str = json_str.strip()
-    
-    # 确保文本以 { 开始 } 结束
-    if not (json_str.startswith('{') and json_str.endswith('}')):
-        lines = json_str.split('\n')
-        result = []
-        run = False
-        for line in lines:
-            if line.startswith('{'):
-                run = True
-            if run:
-                result.append(line)
-            if line.startswith('}'):
-                run = False
-        try:
-            return json.loads(''.join(result))
-        except json.JSONDecodeError:
-            print(f"JSON解码失败：\n{result}")
-            return None
-            
-    try:
-        return json.loads(json_str)
-    except json.JSONDecodeError:
-        print(f"JSON解码失败：\n{json_str}")
-        return None
+    return extract_json(json_str)
+
 def generate_summary(client: OpenAI, content: str, prompt_type: str) -> Dict:
     """生成内容摘要
     
@@ -134,70 +204,416 @@ def generate_summary(client: OpenAI, content: str, prompt_type: str) -> Dict:
     """
     if len(content) > MAX_LENGTH:
         content = content[:MAX_LENGTH]
-    for attempt in range(MAX_RETRY):    
-        response = retry_api_call(
-            client,
-            f"请按格式处理以下内容：\n\n{content}",
-            SYSTEM_PROMPTS[prompt_type]
-        )
-        
-        print(f"模型返回长度:{len(response)}")
+    summary_obj = None
+    # 首次请求之外最多重新请求MAX_RETRY次
+    for attempt in range(MAX_RETRY + 1):
+        # 流式接收并检查输出结构，明显不是JSON时立即中止并重新请求，不必等待完整输出
+        try:
+            response = retry_api_call(
+                client,
+                f"请按格式处理以下内容：\n\n{content}",
+                SYSTEM_PROMPTS[prompt_type],
+                on_delta=StreamingJsonValidator()
+            )
+        except MalformedJsonError as e:
+            logger.warning(f"摘要输出格式错误，已中止（第{attempt + 1}次）：{str(e)}")
+            continue
+        
+        logger.info(f"模型返回长度:{len(response)}")
         summary_obj = decode_json(response)
         if summary_obj is not None:
             break
         
     return summary_obj
 
-def process_pdf_file(pdf_file: str, output_dir: str, api_key: Optional[str] = None, enable_cache: bool = True) -> Tuple[List[List[str]], List[List[str]], str, str]:
-    """处理PDF文件并生成摘要
+def split_summary_groups(content: str) -> List[List[Tuple[str, str, str, int]]]:
+    """将全文按章节切分并分组，用于map_reduce模式的摘要请求
+    
+    先识别章节标题，未识别到章节时按段落切分为若干部分；单个章节超过SUMMARY_GROUP_TOKENS时拆分为多段，
+    相邻的章节合并为一组，每组不超过SUMMARY_GROUP_TOKENS。
+    
+    Args:
+        content: 全文内容
+        
+    Returns:
+        List[List[Tuple[str, str, str, int]]]: 各组的(章节键, 请求中使用的键, 内容, token数)
+    """
+    chapters = split_chapters(content)
+    if chapters:
+        sections = [(f"第{i}章", body) for i, (title, body) in enumerate(chapters, 1)]
+    else:
+        sections = [(f"第{i}部分", chunk) for i, chunk in enumerate(split_content(content, SUMMARY_GROUP_TOKENS), 1)]
+    
+    # 超长章节拆分为多段
+    pieces = []
+    for label, body in sections:
+        body_tokens = estimate_tokens(body)
+        if body_tokens <= SUMMARY_GROUP_TOKENS:
+            pieces.append((label, label, body, body_tokens))
+        else:
+            for k, part in enumerate(split_content(body, SUMMARY_GROUP_TOKENS), 1):
+                pieces.append((label, f"{label}（{k}）", part, estimate_tokens(part)))
+    
+    groups = []
+    current, current_tokens = [], 0
+    for piece in pieces:
+        if current and current_tokens + piece[3] > SUMMARY_GROUP_TOKENS:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece[3]
+    if current:
+        groups.append(current)
+    logger.info(f"共{len(sections)}段内容，分为{len(groups)}组并发生成摘要")
+    return groups
+
+def summarize_groups(client: OpenAI, groups: List[List[Tuple[str, str, str, int]]], prompt_type: str, max_workers: int = MAX_CONCURRENCY) -> List[Dict]:
+    """并发请求各组的摘要，任一组失败时取消其余未开始的请求
+    
+    Args:
+        client: OpenAI客户端实例
+        groups: split_summary_groups的结果
+        prompt_type: 摘要类型，对应SYSTEM_PROMPTS中的键
+        max_workers: 最大并发请求数，默认为MAX_CONCURRENCY
+        
+    Returns:
+        List[Dict]: 与groups顺序一致的各组结果
+    """
+    def summarize_group(group):
+        group_content = '\n\n'.join(f"【{key}】\n{text}" for _, key, text, _ in group)
+        summary = generate_summary(client, group_content, prompt_type)
+        if summary is None:
+            raise Exception(f"章节摘要生成失败：{group[0][1]}至{group[-1][1]}")
+        return summary
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    futures = [executor.submit(bind_context(summarize_group), group) for group in groups]
+    try:
+        group_summaries = [future.result() for future in futures]
+    except Exception:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return group_summaries
+
+def merge_chapter_summaries(client: OpenAI, groups: List[List[Tuple[str, str, str, int]]], group_summaries: List[Dict]) -> Dict:
+    """按章节合并各组的摘要，拆分过的章节拼接为一条，再根据各章摘要生成"总结"
+    
+    Args:
+        client: OpenAI客户端实例
+        groups: split_summary_groups的结果
+        group_summaries: 各组的{请求中使用的键: 摘要}
+        
+    Returns:
+        Dict: {"第1章": 摘要, ..., "总结": 全文总结}
+    """
+    result = {}
+    for group, summary in zip(groups, group_summaries):
+        for label, key, _, _ in group:
+            if key not in summary:
+                logger.warning(f"模型未返回章节摘要：{key}")
+                continue
+            result[label] = (result[label] + str(summary[key])) if label in result else str(summary[key])
+    
+    reduce_content = '\n\n'.join(f"【{label}】{text}" for label, text in result.items())
+    result["总结"] = retry_api_call(client, reduce_content, SYSTEM_PROMPTS["chapter_summary_reduce"]).strip()
+    return result
+
+def generate_chapter_summary(client: OpenAI, content: str, mode: str = SUMMARY_MODE, max_workers: int = MAX_CONCURRENCY) -> Dict:
+    """生成各章节摘要及全文总结
+    
+    map_reduce模式下将相邻章节按SUMMARY_GROUP_TOKENS分组后并发生成各章摘要，
+    再根据各章摘要生成"总结"，不再截断长书的结尾。
+    
+    Args:
+        client: OpenAI客户端实例
+        content: 需要生成摘要的内容
+        mode: 摘要模式，"map_reduce"或"single"，默认为SUMMARY_MODE
+        max_workers: 最大并发请求数，默认为MAX_CONCURRENCY
+        
+    Returns:
+        Dict: {"第1章": 摘要, ..., "总结": 全文总结}
+        
+    Raises:
+        Exception: 当摘要生成失败时抛出异常
+    """
+    if mode != "map_reduce" or estimate_tokens(content) <= SUMMARY_GROUP_TOKENS:
+        return generate_summary(client, content, "chapter_summary")
+    
+    groups = split_summary_groups(content)
+    return merge_chapter_summaries(client, groups, summarize_groups(client, groups, "chapter_summary_map", max_workers))
+
+def generate_combined_summary(client: OpenAI, content: str, mode: str = SUMMARY_MODE, max_workers: int = MAX_CONCURRENCY) -> Tuple[Dict, Dict]:
+    """在同一次请求中同时生成章节摘要和人物志
+    
+    与分别调用generate_chapter_summary和generate_summary(..., "character_summary")相比，
+    全文只发送一遍，输入token和耗时约减少一半。map_reduce模式下每组同时返回章节摘要和该组出现的人物，
+    同一人物在多组中的描述按顺序合并。
+    
+    Args:
+        client: OpenAI客户端实例
+        content: 需要生成摘要的内容
+        mode: 摘要模式，"map_reduce"或"single"，默认为SUMMARY_MODE
+        max_workers: 最大并发请求数，默认为MAX_CONCURRENCY
+        
+    Returns:
+        Tuple[Dict, Dict]: 章节摘要{"第1章": 摘要, ..., "总结": 全文总结}以及人物志{人物名: 人物特征}
+        
+    Raises:
+        Exception: 当摘要生成失败时抛出异常
+    """
+    def split_result(summary):
+        summary = summary or {}
+        chapters, characters = summary.get("chapters"), summary.get("characters")
+        return (chapters if isinstance(chapters, dict) else {}), (characters if isinstance(characters, dict) else {})
+    
+    if mode != "map_reduce" or estimate_tokens(content) <= SUMMARY_GROUP_TOKENS:
+        summary = generate_summary(client, content, "combined_summary")
+        if summary is None:
+            raise Exception("章节摘要和人物志生成失败")
+        return split_result(summary)
+    
+    groups = split_summary_groups(content)
+    group_results = [split_result(summary) for summary in summarize_groups(client, groups, "combined_summary_map", max_workers)]
+    characters = {}
+    for _, group_characters in group_results:
+        for name, feature in group_characters.items():
+            feature = str(feature)
+            if name not in characters:
+                characters[name] = feature
+            elif feature not in characters[name]:
+                characters[name] += '\n' + feature
+    return merge_chapter_summaries(client, groups, [chapters for chapters, _ in group_results]), characters
+
+def build_pipeline(client: OpenAI, pdf_file: str, output_dir: str, cache: PDFCache, cached_content: Optional[str] = None, progress: Any = None, on_stage_done: Optional[Callable[[str, Any], None]] = None, llm_cache: Optional[LLMCache] = None, on_translation_update: Optional[Callable[[str], None]] = None, analysis_mode: str = ANALYSIS_MODE) -> StageGraph:
+    """构建PDF处理流水线
+
+    转换完成后先去除页眉页脚，章节摘要、人物志和翻译三条分支随后并发执行，全部完成后保存缓存。
+    缓存中保存的是转换得到的原文，去除页眉页脚只影响发送给模型的内容。
+    analysis_mode为"combined"时章节摘要和人物志由同一个analysis阶段一次生成。
+
+    Args:
+        client: OpenAI客户端实例
+        pdf_file: PDF文件路径
+        output_dir: 输出目录
+        cache: PDF缓存实例
+        cached_content: 缓存中已有的Markdown内容，提供时跳过PDF转换
+        progress: gradio进度条对象，默认为None
+        on_stage_done: 阶段完成回调，参数为(阶段名称, 阶段结果)
+        llm_cache: 模型响应缓存，默认为None
+        on_translation_update: 译文流式更新回调，默认为None
+        analysis_mode: "separate"分别请求章节摘要和人物志，"combined"在同一次请求中生成，默认为ANALYSIS_MODE
+
+    Returns:
+        StageGraph: 待执行的流水线
+    """
+    def convert(results, stage_progress):
+        if cached_content is not None:
+            return cached_content
+        return convert_pdf_to_markdown(pdf_file, output_dir)
+
+    def clean(results, stage_progress):
+        if not ENABLE_BOILERPLATE_STRIP:
+            return results["convert"]
+        cleaned, stats = strip_boilerplate(results["convert"])
+        record_preprocess(stats["removed_chars"], stats["removed_tokens"])
+        return cleaned
+
+    def chapter_summary(results, stage_progress):
+        summary = generate_chapter_summary(client, results["clean"])
+        return [[chapter, content] for chapter, content in summary.items()]
+
+    def character_summary(results, stage_progress):
+        summary = generate_summary(client, results["clean"], "character_summary")
+        return [[name, feature] for name, feature in summary.items()]
+
+    def analysis(results, stage_progress):
+        return generate_combined_summary(client, results["clean"])
+
+    def split_chapter_summary(results, stage_progress):
+        return [[chapter, content] for chapter, content in results["analysis"][0].items()]
+
+    def split_character_summary(results, stage_progress):
+        return [[name, feature] for name, feature in results["analysis"][1].items()]
+
+    def translation(results, stage_progress):
+        return translate_content(client, results["clean"], stage_progress, cache=llm_cache,
+                                 on_update=on_translation_update)
+
+    def save(results, stage_progress):
+        return cache.save_cache(pdf_file, results["convert"], results["chapter_summary"],
+                                results["character_summary"], results["translation"],
+                                build_index(results["convert"], results["translation"]))
+
+    graph = StageGraph(progress, on_stage_done)
+    graph.add_stage("convert", convert, weight=0.18, desc="正在转换PDF到Markdown")
+    graph.add_stage("clean", clean, ["convert"], weight=0.02, desc="正在去除页眉页脚")
+    if analysis_mode == "combined":
+        graph.add_stage("analysis", analysis, ["clean"], weight=0.3, desc="正在生成章节摘要和人物志")
+        graph.add_stage("chapter_summary", split_chapter_summary, ["analysis"], weight=0.0, desc="正在生成章节摘要")
+        graph.add_stage("character_summary", split_character_summary, ["analysis"], weight=0.0, desc="正在生成人物志")
+    else:
+        graph.add_stage("chapter_summary", chapter_summary, ["clean"], weight=0.15, desc="正在生成章节摘要")
+        graph.add_stage("character_summary", character_summary, ["clean"], weight=0.15, desc="正在生成人物志")
+    graph.add_stage("translation", translation, ["clean"], weight=0.45, desc="正在翻译内容")
+    graph.add_stage("save_cache", save, ["convert", "chapter_summary", "character_summary", "translation"], weight=0.05, desc="正在保存缓存")
+    return graph
+
+def run_job(flight: Flight, pdf_file: str, output_dir: str, api_key: Optional[str], enable_cache: bool, md5_hash: str, entry: Optional[CacheEntry] = None, on_stage_done: Optional[Callable[[str, Any], None]] = None, analysis_mode: str = ANALYSIS_MODE) -> None:
+    """处理一本书，并将进度和中间结果发布到flight，在后台线程中执行
+    
+    启用ENABLE_JOB_LOCK时先在缓存数据库中获取该文件的处理锁，其他进程正在处理同一文件时
+    等待其完成并直接使用其写入的缓存。
+    
+    Args:
+        flight: 发布结果的任务
+        pdf_file: PDF文件路径
+        output_dir: 输出目录
+        api_key: API密钥
+        enable_cache: 是否启用缓存
+        md5_hash: 文件指纹
+        entry: 已有的缓存记录，提供时跳过PDF转换
+        on_stage_done: 阶段完成回调，参数为(阶段名称, 阶段结果)
+        analysis_mode: 章节摘要和人物志的生成方式，"separate"或"combined"
+    """
+    with job_report(os.path.basename(pdf_file)):
+        cache = get_pdf_cache()
+        owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        locked = False
+        try:
+            if ENABLE_JOB_LOCK:
+                waited = False
+                while not cache.acquire_job_lock(md5_hash, owner, JOB_LOCK_TTL):
+                    if not waited:
+                        logger.info(f"其他进程正在处理相同文件，等待其完成：{md5_hash}")
+                        flight.publish(progress=(0.0, "等待其他进程处理相同文件"))
+                        waited = True
+                    time.sleep(JOB_LOCK_POLL)
+                locked = True
+                if waited and enable_cache:
+                    done_entry = cache.get_entry(pdf_file)
+                    if done_entry:
+                        flight.publish((done_entry.chapter_data, done_entry.character_data, done_entry.content, done_entry.translation),
+                                       (1.0, "从缓存加载内容"))
+                        flight.finish()
+                        return
+        
+            state = {"chapter_summary": [], "character_summary": [], "convert": "", "translation": ""}
+            last_refresh = [time.monotonic()]
+        
+            def publish(progress=None):
+                flight.publish((state["chapter_summary"], state["character_summary"], state["convert"], state["translation"]), progress)
+                if locked and time.monotonic() - last_refresh[0] > JOB_LOCK_TTL / 4:
+                    cache.refresh_job_lock(md5_hash, owner, JOB_LOCK_TTL)
+                    last_refresh[0] = time.monotonic()
+        
+            def stage_done(name, result):
+                if name in state:
+                    state[name] = result
+                publish()
+                if on_stage_done:
+                    on_stage_done(name, result)
+        
+            def translation_update(text):
+                state["translation"] = text
+                publish()
+        
+            def stage_progress(value, desc=None):
+                publish((value, desc))
+        
+            publish((0.0, "开始处理"))
+            client = create_client(api_key)
+            graph = build_pipeline(client, pdf_file, output_dir, cache,
+                                   entry.content if entry else None, stage_progress, stage_done,
+                                   get_llm_cache() if enable_cache else None, translation_update, analysis_mode)
+            graph.run()
+            logger.info("各阶段耗时：" + "，".join(f"{name} {elapsed:.2f}秒" for name, elapsed in graph.timings.items()))
+            publish((1.0, "处理完成"))
+            flight.finish()
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            if locked:
+                cache.release_job_lock(md5_hash, owner)
+
+def iter_process_pdf_file(pdf_file: str, output_dir: str, api_key: Optional[str] = None, enable_cache: bool = True, on_stage_done: Optional[Callable[[str, Any], None]] = None, analysis_mode: str = ANALYSIS_MODE, progress: Any = None) -> Iterator[Tuple[List[List[str]], List[List[str]], str, str]]:
+    """处理PDF文件并逐步返回结果
+    
+    转换完成后先返回原文，每完成一项摘要返回一次，译文随片段完成逐步增长。
+    每次返回的都是当前的完整结果，相邻两次返回至少间隔STREAM_INTERVAL秒。
+    同一文件已在以相同的摘要方式和缓存选项处理中时不会重复处理，而是等待并共享该任务的进度和结果。
     
     Args:
         pdf_file: PDF文件路径
         output_dir: 输出目录
         api_key: API密钥，默认为None
         enable_cache: 是否启用缓存，默认为True
+        on_stage_done: 阶段完成回调，参数为(阶段名称, 阶段结果)；加入已有任务时不会被调用
+        analysis_mode: "separate"分别请求章节摘要和人物志，"combined"在同一次请求中生成，默认为ANALYSIS_MODE
+        progress: 进度条对象，例如gradio的gr.Progress，默认为None
         
-    Returns:
+    Yields:
         Tuple[List[List[str]], List[List[str]], str, str]: 
-            - 章节数据：[章节名, 摘要内容]
-            - 人物数据：[人物名, 人物特征]
+            - 章节数据：[章节名, 摘要内容]，未完成时为空列表
+            - 人物数据：[人物名, 人物特征]，未完成时为空列表
             - Markdown内容
-            - 翻译内容
+            - 目前已完成的翻译内容
     """
     try:
-        progress = gr.Progress()
-        cache = PDFCache()
-        cache_result = cache.get_cache(pdf_file)
+        if pdf_file is None:
+            raise ValueError("PDF文件不能为空")
+        cache = get_pdf_cache()
+        entry = cache.get_entry(pdf_file)
         
-        if cache_result:
-            update_progress(progress, 0.2, "从缓存加载内容")
-            md_content = cache_result[0]
-        else:
-            update_progress(progress, 0, "开始转换PDF到Markdown")
-            md_content = convert_pdf_to_markdown(pdf_file, output_dir)
-            update_progress(progress, 0.2, f"PDF转换完成，内容长度：{len(md_content)}")
-        if not (enable_cache and cache_result):
-            client = create_client(api_key)
-            
-            update_progress(progress, 0.3, "正在生成章节摘要")
-            chapter_summary =  generate_summary(client, md_content, "chapter_summary")
-            chapter_data = [[chapter, content] for chapter, content in chapter_summary.items()]
-            
-            update_progress(progress, 0.5, "正在生成人物志")
-            character_summary =  generate_summary(client, md_content, "character_summary")
-            character_data = [[name, feature] for name, feature in character_summary.items()]
-            
-            update_progress(progress, 0.6, "正在翻译内容")
-            translation =  translate_content(client, md_content, progress)
-            
-            update_progress(progress, 0.9, "正在保存缓存")
-            cache.save_cache(pdf_file, md_content, chapter_data, character_data, translation)
-            update_progress(progress, 1.0, "处理完成")
-        else:
-            md_content, chapter_data, character_data, translation = cache_result
-            
-        return chapter_data, character_data, md_content, translation
+        if enable_cache and entry:
+            # 摘要立即返回，原文和译文随后按需加载
+            update_progress(progress, 0.5, "从缓存加载内容")
+            yield entry.chapter_data, entry.character_data, "", ""
+            yield entry.chapter_data, entry.character_data, entry.content, ""
+            update_progress(progress, 1.0, "从缓存加载内容")
+            yield entry.chapter_data, entry.character_data, entry.content, entry.translation
+            return
+        
+        md5_hash = entry.md5_hash if entry else cache.calculate_md5(pdf_file)
+        # 摘要方式或缓存选项不同时结果不同，只有选项一致的请求才共享同一个任务；
+        # API密钥不影响结果，加入已有任务时沿用发起者的密钥
+        flight_key = (md5_hash, analysis_mode, enable_cache)
+        flight, leader = job_flights.join(flight_key, lambda flight: threading.Thread(
+            target=run_job,
+            args=(flight, pdf_file, output_dir, api_key, enable_cache, md5_hash, entry, on_stage_done, analysis_mode),
+            daemon=True
+        ).start())
+        if not leader:
+            logger.info(f"相同文件正在以相同选项处理中，等待其结果：{md5_hash}（{analysis_mode}）")
+        
+        for (value, desc), snapshot in flight.subscribe(STREAM_INTERVAL):
+            update_progress(progress, value, desc)
+            yield snapshot
         
     except Exception as e:
         error_msg = str(e)
-        return [["错误", error_msg]], [["错误", error_msg]], "", ""
\ No newline at end of file
+        yield [["错误", error_msg]], [["错误", error_msg]], "", ""
+
+def process_pdf_file(pdf_file: str, output_dir: str, api_key: Optional[str] = None, enable_cache: bool = True, on_stage_done: Optional[Callable[[str, Any], None]] = None, analysis_mode: str = ANALYSIS_MODE, progress: Any = None) -> Tuple[List[List[str]], List[List[str]], str, str]:
+    """处理PDF文件并生成摘要
+    
+    Args:
+        pdf_file: PDF文件路径
+        output_dir: 输出目录
+        api_key: API密钥，默认为None
+        enable_cache: 是否启用缓存，默认为True
+        on_stage_done: 阶段完成回调，参数为(阶段名称, 阶段结果)，可在翻译进行中先使用已完成的摘要
+        analysis_mode: "separate"分别请求章节摘要和人物志，"combined"在同一次请求中生成，默认为ANALYSIS_MODE
+        progress: 进度条对象，例如gradio的gr.Progress，默认为None
+        
+    Returns:
+        Tuple[List[List[str]], List[List[str]], str, str]: 
+            - 章节数据：[章节名, 摘要内容]
+            - 人物数据：[人物名, 人物特征]
+            - Markdown内容
+            - 翻译内容
+    """
+    result = None
+    for result in iter_process_pdf_file(pdf_file, output_dir, api_key, enable_cache, on_stage_done, analysis_mode, progress):
+        pass
+    return result
@@ -0,0 +1,186 @@
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+from config import VIEWER_PAGE_CHARS
+from helpers import CHAPTER_PATTERN
+from database import get_pdf_cache
+
+# 章节识别规则变化时递增，旧索引中的目录随之重新生成
+INDEX_VERSION = 3
+
+def paginate(text: str, page_chars: int = VIEWER_PAGE_CHARS) -> List[int]:
+    """按页切分文本，返回各页的起始位置
+
+    每页不超过page_chars个字符，优先在段落之间分页，其次在行尾分页。
+    前面页的分页位置只取决于之前的内容，文本在末尾增长时已有的分页不变。
+
+    Args:
+        text: 文本
+        page_chars: 每页的最大字符数
+
+    Returns:
+        List[int]: 各页的起始位置，至少包含一页
+    """
+    starts = [0]
+    pos = 0
+    while len(text) - pos > page_chars:
+        limit = pos + page_chars
+        floor = pos + page_chars // 2
+        cut = text.rfind('\n\n', floor, limit)
+        if cut >= 0:
+            pos = cut + 2
+        else:
+            cut = text.rfind('\n', floor, limit)
+            pos = cut + 1 if cut >= 0 else limit
+        starts.append(pos)
+    return starts
+
+def align_pages(text: str, source_starts: List[int], source_length: int) -> List[int]:
+    """按原文的分页位置等比例切分译文，使对照阅读时两边的页码一一对应
+
+    每个分页位置对齐到比例位置附近最近的段落或行尾。
+
+    Args:
+        text: 译文
+        source_starts: 原文各页的起始位置
+        source_length: 原文长度
+
+    Returns:
+        List[int]: 译文各页的起始位置，页数与原文相同
+    """
+    ratio = len(text) / source_length if source_length else 0.0
+    window = max(200, int(VIEWER_PAGE_CHARS * ratio) // 4)
+    starts = [0]
+    for source_start in source_starts[1:]:
+        target = min(len(text), max(starts[-1], int(source_start * ratio)))
+        for separator in ('\n\n', '\n'):
+            before = text.rfind(separator, max(starts[-1], target - window), target)
+            after = text.find(separator, target, target + window)
+            candidates = [i + len(separator) for i in (before, after) if i >= 0]
+            if candidates:
+                target = min(candidates, key=lambda i: abs(i - target))
+                break
+        starts.append(max(starts[-1], min(target, len(text))))
+    return starts
+
+def find_chapters(text: str, starts: List[int], max_title_length: int = 80) -> List[Tuple[str, int]]:
+    """识别章节标题，返回(标题, 所在页码)，页码从1开始"""
+    chapters = []
+    page = 0
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if stripped and len(stripped) <= max_title_length and CHAPTER_PATTERN.match(stripped):
+            while page + 1 < len(starts) and starts[page + 1] <= offset:
+                page += 1
+            chapters.append((stripped.lstrip('#').strip(), page + 1))
+        offset += len(line)
+    return chapters
+
+def build_index(content: str, translation: Optional[str], complete: bool = True) -> Dict[str, Any]:
+    """生成原文和译文的分页及章节索引
+
+    Args:
+        content: 原文
+        translation: 译文
+        complete: 译文是否已完成；完成时按原文分页对齐，未完成时单独分页，已翻译部分的分页不随翻译进行而变化
+
+    Returns:
+        Dict[str, Any]: 可保存为JSON的索引
+    """
+    content = content or ""
+    translation = translation or ""
+    content_pages = paginate(content)
+    if complete and translation:
+        translation_pages = align_pages(translation, content_pages, len(content))
+    else:
+        translation_pages = paginate(translation)
+    return {
+        "version": INDEX_VERSION,
+        "content_length": len(content),
+        "translation_length": len(translation),
+        "content_pages": content_pages,
+        "translation_pages": translation_pages,
+        "chapters": find_chapters(content, content_pages),
+    }
+
+def index_matches(index: Optional[Dict[str, Any]], content: str, translation: Optional[str]) -> bool:
+    """已保存的索引是否对应当前文本"""
+    return bool(index) and index.get("version") == INDEX_VERSION \
+        and index.get("content_length") == len(content or "") and index.get("translation_length") == len(translation or "")
+
+def open_book(content: str, translation: Optional[str], index: Optional[Dict[str, Any]] = None, complete: bool = True) -> Dict[str, Any]:
+    """创建阅读器状态，提供的索引与文本不一致时重新生成
+
+    Args:
+        content: 原文
+        translation: 译文
+        index: 缓存中保存的索引，默认为None
+        complete: 译文是否已完成
+
+    Returns:
+        Dict[str, Any]: {"content": 原文, "translation": 译文, "index": 索引}
+    """
+    if not index_matches(index, content, translation):
+        index = build_index(content, translation, complete)
+    return {"content": content or "", "translation": translation or "", "index": index}
+
+def open_cached_book(md5_hash: str, content: str, translation: Optional[str]) -> Dict[str, Any]:
+    """使用缓存中保存的索引创建阅读器状态，旧记录没有索引时生成后写回缓存"""
+    cache = get_pdf_cache()
+    index = cache.get_index(md5_hash)
+    book = open_book(content, translation, index)
+    if book["index"] is not index and content and translation:
+        cache.save_index(md5_hash, book["index"])
+    return book
+
+def page_count(book: Optional[Dict[str, Any]]) -> int:
+    if not book:
+        return 0
+    index = book["index"]
+    return max(len(index["content_pages"]), len(index["translation_pages"]))
+
+def page_of(starts: List[int], position: int) -> int:
+    """文本中某个位置所在的页码，页码从1开始"""
+    return max(bisect_right(starts, position), 1)
+
+def page_slice(text: str, starts: List[int], page: int) -> str:
+    """第page页的内容，页码从1开始，超出范围时返回空字符串"""
+    if page < 1 or page > len(starts):
+        return ""
+    end = starts[page] if page < len(starts) else len(text)
+    return text[starts[page - 1]:end]
+
+def render_page(book: Optional[Dict[str, Any]], page: Any) -> Tuple[int, str, str, str]:
+    """取出一页原文和对应的译文
+
+    Args:
+        book: open_book返回的阅读器状态
+        page: 页码，从1开始，超出范围时取最近的一页
+
+    Returns:
+        Tuple[int, str, str, str]: 实际页码、页码说明、原文、译文
+    """
+    total = page_count(book)
+    if not total:
+        return 1, "", "", ""
+    page = min(max(int(page or 1), 1), total)
+    index = book["index"]
+    return (
+        page,
+        f"第{page}/{total}页",
+        page_slice(book["content"], index["content_pages"], page),
+        page_slice(book["translation"], index["translation_pages"], page),
+    )
+
+def chapter_choices(book: Optional[Dict[str, Any]]) -> List[Tuple[str, int]]:
+    """章节下拉框的选项：(显示文字, 章节序号)"""
+    if not book:
+        return []
+    return [(f"{title}（第{page}页）", i) for i, (title, page) in enumerate(book["index"]["chapters"])]
+
+def chapter_page(book: Optional[Dict[str, Any]], chapter: Any) -> int:
+    """章节所在的页码，章节不存在时返回1"""
+    chapters = book["index"]["chapters"] if book else []
+    if chapter is None or not 0 <= int(chapter) < len(chapters):
+        return 1
+    return chapters[int(chapter)][1]